@@ -0,0 +1,66 @@
+"""
+Timing helpers shared by the bench modules.
+"""
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+
+def summarize(samples: List[float], peaks: List[int]) -> Dict:
+    """Latency percentiles (µs), throughput and peak allocation per call."""
+    samples = sorted(samples)
+    total = sum(samples)
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1e6, 2)
+
+    return {
+        "calls": len(samples),
+        "p50_us": pct(50),
+        "p95_us": pct(95),
+        "p99_us": pct(99),
+        "mean_us": round(total / len(samples) * 1e6, 2),
+        "ops_per_sec": round(len(samples) / total) if total else 0,
+        "peak_alloc_bytes": round(statistics.mean(peaks)) if peaks else 0,
+    }
+
+
+def measure(fn: Callable[[], object], calls: int = 2000, warmup: int = 100, alloc_calls: int = 200) -> Dict:
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    # Allocation pass is separate, tracemalloc would skew the timings
+    peaks = []
+    tracemalloc.start()
+    for _ in range(alloc_calls):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return summarize(samples, peaks)
+
+
+async def measure_async(fn: Callable[[], Awaitable], calls: int = 500, warmup: int = 20) -> Dict:
+    for _ in range(warmup):
+        await fn()
+
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, [])
+
+
+def run_async(coro):
+    return asyncio.run(coro)
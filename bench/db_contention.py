@@ -0,0 +1,107 @@
+"""
+Write-contention benchmark: several worker processes (like several
+uvicorn workers) run chat-turn style transactions against one database.
+Each transaction updates a chat_sessions row and inserts a contract.
+
+    python -m bench.db_contention [--workers 4] [--turns 200]
+    python -m bench.db_contention --postgres-url postgresql://user:pw@localhost/bench
+
+Profiles compared: SQLite as it was configured before (default journal
+and pragmas, no busy timeout), the SQLite WAL profile from database.py,
+and Postgres when --postgres-url is given. Use a throwaway
+Postgres database; the tables are dropped and recreated.
+"""
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+from bench.common import summarize
+
+
+def _make_engine(url, profile):
+    from sqlalchemy import create_engine
+    from database import create_engines
+
+    if profile == "legacy":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engines(url)[0]
+
+
+def _worker(url, profile, worker_id, turns, queue):
+    from sqlalchemy import update
+    from sqlalchemy.orm import sessionmaker
+    from models import ChatSession, Contract
+
+    engine = _make_engine(url, profile)
+    Session = sessionmaker(bind=engine)
+    samples, errors = [], 0
+    with Session() as db:
+        row = ChatSession(session_id=f"contention-{worker_id}", data={})
+        db.add(row)
+        db.commit()
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                db.execute(update(ChatSession).where(ChatSession.id == row.id)
+                           .values(step=f"STEP_{turn}", data={"turn": turn}))
+                db.add(Contract(session_id=row.id, email=f"w{worker_id}-{turn}@example.com",
+                                name="Bench", phone="2125550100", address="1 Bench St"))
+                db.commit()
+            except Exception:
+                db.rollback()
+                errors += 1
+            samples.append(time.perf_counter() - start)
+    engine.dispose()
+    queue.put((samples, errors))
+
+
+def run_profile(url, profile, workers, turns):
+    from database import Base
+    import models  # noqa: F401
+
+    engine = _make_engine(url, profile)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(url, profile, i, turns, queue)) for i in range(workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - start
+
+    samples = [s for r, _ in results for s in r]
+    stats = summarize(samples, [])
+    stats["errors"] = sum(e for _, e in results)
+    stats["commits_per_sec_wall"] = round(len(samples) / wall)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--postgres-url", help="throwaway Postgres database to include")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="chatbot-contention-")
+    profiles = {
+        "sqlite_legacy": (f"sqlite:///{tmp}/legacy.db", "legacy"),
+        "sqlite_wal": (f"sqlite:///{tmp}/wal.db", "tuned"),
+    }
+    if args.postgres_url:
+        profiles["postgres"] = (args.postgres_url, "tuned")
+
+    report = {name: run_profile(url, profile, args.workers, args.turns)
+              for name, (url, profile) in profiles.items()}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
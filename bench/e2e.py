@@ -0,0 +1,97 @@
+"""
+End-to-end benchmarks against a throwaway SQLite database:
+process_message over replayed multi-turn conversations, plus the
+HTTP routes through the in-process ASGI app. http.chat_stream is a full
+chat turn over SSE (process_message and its session flush);
+http.chat_filter is POST /chat, which only parses a filter.
+
+    python -m bench.e2e [--sessions N]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from bench.common import measure_async, run_async, summarize
+
+CONVERSATIONS = Path(__file__).with_name("conversations.jsonl")
+
+
+def _use_temp_database():
+    # Must run before anything imports `database`; later calls are no-ops
+    import config
+    if config.DATABASE_URL.endswith("/bench.db"):
+        return
+    if "database" in sys.modules:
+        raise RuntimeError("bench.e2e must configure the database before it is imported")
+
+    tmp = tempfile.mkdtemp(prefix="chatbot-bench-")
+    config.DATABASE_URL = f"sqlite:///{tmp}/bench.db"
+    config.CATALOG_CACHE_PATH = f"{tmp}/catalog.json"
+    config.OUTBOX_WORKER_ENABLED = False
+    config.HUBSPOT_ACCESS_TOKEN = ""
+
+
+def load_conversations(path: Path = CONVERSATIONS):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _replay(sessions: int):
+    from database import AsyncSessionLocal
+    from services.brain import process_message
+
+    conversations = load_conversations()
+    samples, per_conversation = [], {}
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for n in range(sessions):
+            for conv in conversations:
+                session_id = f"bench-{conv['name']}-{n}"
+                for turn in conv["turns"]:
+                    t0 = time.perf_counter()
+                    await process_message(db, session_id, turn["message"], turn.get("context"))
+                    elapsed = time.perf_counter() - t0
+                    samples.append(elapsed)
+                    per_conversation.setdefault(conv["name"], []).append(elapsed)
+    wall = time.perf_counter() - start
+
+    result = {"process_message": summarize(samples, [])}
+    result["process_message"]["turns_per_sec_wall"] = round(len(samples) / wall)
+    for name, conv_samples in per_conversation.items():
+        result[f"process_message.{name}"] = summarize(conv_samples, [])
+    return result
+
+
+async def _http(calls: int):
+    import httpx
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        filter_body = {"context": "USERS", "query": "users where age > 30 and status = 'active'"}
+        chat_body = {"session_id": "bench-http", "message": "age > 30", "context": "USERS"}
+        stream_body = {"session_id": "bench-http", "message": "show users where age > 30", "context": "USERS"}
+        return {
+            "http.filter": await measure_async(lambda: client.post("/api/filter", json=filter_body), calls),
+            "http.chat_filter": await measure_async(lambda: client.post("/chat", json=chat_body), calls),
+            "http.chat_stream": await measure_async(lambda: client.post("/chat/stream", json=stream_body), calls),
+        }
+
+
+def run(sessions: int = 50, calls: int = 500):
+    _use_temp_database()
+    from database import Base, engine
+    import models  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+
+    results = run_async(_replay(sessions))
+    results.update(run_async(_http(calls)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    print(json.dumps(run(parser.parse_args().sessions), indent=2))
@@ -0,0 +1,55 @@
+"""
+FilterBuilder.parse_query microbenchmarks, one case per query shape.
+
+    python -m bench.filters
+"""
+import json
+from services.catalog import ContextCatalog, build_trie
+from services.filter_builder import build_filter, get_filter_builder, parse
+from bench.common import measure
+from bench.e2e import _use_temp_database
+
+CASES = {
+    "equality": ("USERS", "show users where name is 'John' and status = 'active'"),
+    "comparison": ("USERS", "users where age > 30 and age less than 65"),
+    "between": ("USERS", "users with age between 20 and 30"),
+    "like": ("CONTRACTS", "contracts where email contains 'gmail'"),
+    "or": ("USERS", "users where age > 60 or status is 'vip'"),
+    "order_limit": ("USERS", "users where age >= 18 order by name desc limit 10"),
+    "max": ("USERS", "maximum age"),
+    "min": ("USERS", "min age where status = 'active'"),
+    "avg": ("USERS", "average age"),
+    "count": ("CONTRACTS", "how many contracts where status = 'PENDING'"),
+    "update": ("USERS", "update users set status = 'inactive' where id = 5"),
+    "long": ("USERS", " and ".join(f"age > {i}" for i in range(50))),
+}
+
+WIDE_COLUMNS = 500
+WIDE_QUERY = "rows where attr 499 value > 3 and last attribute < 9 and username = 'bob' order by attr_7_value"
+
+
+def _wide_catalog(n: int = WIDE_COLUMNS) -> ContextCatalog:
+    """A synthetic context with n columns, to check that column lookup doesn't grow with the table"""
+    columns = {"name": {"type": "STRING"}, "username": {"type": "STRING"}}
+    columns.update({f"attr_{i}_value": {"type": "INTEGER"} for i in range(n)})
+    trie = build_trie(columns, {f"attr_{n - 1}_value": ["last attribute"]})
+    return ContextCatalog("WIDE", "wide", columns, trie)
+
+
+def run(calls: int = 2000):
+    # The column catalog is reflected from the database on first use
+    _use_temp_database()
+    results = {}
+    for name, (context, query) in CASES.items():
+        builder = get_filter_builder(context)
+        results[f"parse_query.{name}"] = measure(lambda: builder.parse_query(query), calls)
+    # Same query through the public, cached entry point
+    context, query = CASES["equality"]
+    results["build_filter.cached"] = measure(lambda: build_filter(context, query), calls)
+    wide = _wide_catalog()
+    results[f"parse.{WIDE_COLUMNS}_columns"] = measure(lambda: parse(WIDE_QUERY, wide.columns, wide), calls)
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
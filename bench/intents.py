@@ -0,0 +1,51 @@
+"""
+Accuracy and throughput of services.action.detect_action over a labelled corpus.
+
+    python -m bench.intents [--repeat N]
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from services.action import detect_action
+from bench.common import measure
+
+CORPUS = Path(__file__).with_name("intent_corpus.jsonl")
+
+
+def load_corpus(path: Path = CORPUS):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(repeat: int = 2000):
+    corpus = load_corpus()
+
+    misses = [(row, detect_action(row["message"])) for row in corpus]
+    misses = [(row, got) for row, got in misses if got != row["label"]]
+    confusion = Counter((row["label"], got) for row, got in misses)
+
+    messages = [row["message"] for row in corpus]
+    chars = sum(len(m) for m in messages) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for m in messages:
+            detect_action(m)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "messages": len(corpus),
+        "accuracy": round(1 - len(misses) / len(corpus), 4),
+        "confusion": {f"{want}->{got}": n for (want, got), n in confusion.items()},
+        "misclassified": [{"message": row["message"], "label": row["label"], "got": got} for row, got in misses],
+        "msgs_per_sec": round(len(messages) * repeat / elapsed),
+        "ns_per_char": round(elapsed / chars * 1e9, 1),
+        "latency": measure(lambda: detect_action("show me users where age > 30 with status 'active'")),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    print(json.dumps(run(parser.parse_args().repeat), indent=2))
@@ -0,0 +1,260 @@
+"""
+Replay recorded chat traffic with its original timing.
+
+Reads a turn log (JSONL, one {"t", "session_id", "message", "context",
+"idempotency_key", "reply"} per line, as written by CHAT_RECORD_LOG)
+as a stream and sends every turn at its recorded offset, divided by
+--speed. Turns of one session stay in order, different sessions run
+concurrently. Recorded replies are checked against the new ones.
+Lines without session_id/message are skipped.
+
+    python -m bench.replay traffic.jsonl [--speed 4] [--target brain|http] [--url http://host:8000]
+    python -m bench.replay traffic.jsonl --sweep 1,2,4,8,16
+    python -m bench.replay --synthesize traffic.jsonl [--sessions 200] [--rate 20]
+
+--speed 0 sends as fast as possible. The brain target calls
+process_message against a throwaway SQLite database. The http target posts
+to /chat/stream, either in-process or on --url. --synthesize builds a
+log from bench/conversations.jsonl with Poisson session arrivals and
+think time between turns.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+from bench.common import summarize
+from bench.e2e import _use_temp_database, load_conversations
+
+IGNORE_KEYS = ("contract_id",)
+
+
+# ==========================================================
+# LOG
+# ==========================================================
+
+def iter_log(path: str, skipped: List[int]) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            try:
+                turn = json.loads(line)
+            except ValueError:
+                turn = None
+            if not isinstance(turn, dict) or "session_id" not in turn or "message" not in turn:
+                skipped[0] += 1
+                continue
+            yield turn
+
+
+def synthesize(path: str, sessions: int = 200, rate: float = 20.0, think: float = 2.0, seed: int = 0):
+    """Write a timed log: sessions start as a Poisson process, turns follow after exponential think time."""
+    rng = random.Random(seed)
+    conversations = load_conversations()
+    turns, start = [], 0.0
+    for n in range(sessions):
+        start += rng.expovariate(rate)
+        conv = rng.choice(conversations)
+        t = start
+        for turn in conv["turns"]:
+            turns.append({"t": round(t, 6), "session_id": f"{conv['name']}-{n}",
+                          "message": turn["message"], "context": turn.get("context")})
+            t += rng.expovariate(1 / think)
+    turns.sort(key=lambda turn: turn["t"])
+    with open(path, "w") as f:
+        for turn in turns:
+            f.write(json.dumps(turn) + "\n")
+    return len(turns)
+
+
+# ==========================================================
+# TARGETS
+# ==========================================================
+
+def brain_target():
+    _use_temp_database()
+    from database import AsyncSessionLocal, Base, engine
+    import models  # noqa: F401
+    from services.brain import process_message
+    Base.metadata.create_all(bind=engine)
+
+    async def send(turn: Dict, session_id: str):
+        async with AsyncSessionLocal() as db:
+            return await process_message(db, session_id, turn["message"], turn.get("context"),
+                                         turn.get("idempotency_key"))
+    return send, nullcontext()
+
+
+def http_target(url: Optional[str]):
+    """
+    In-process, the app's lifespan runs around the replay so the outbox
+    worker is up: ASGITransport buffers whole responses, so every stream
+    would otherwise sit out STREAM_SYNC_WAIT on its HubSpot sync.
+    """
+    import httpx
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+        lifespan = nullcontext()
+    else:
+        _use_temp_database()
+        import config
+        config.OUTBOX_WORKER_ENABLED = True
+        from database import Base, engine
+        from main import app
+        Base.metadata.create_all(bind=engine)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay")
+        lifespan = app.router.lifespan_context(app)
+
+    async def send(turn: Dict, session_id: str):
+        body = {"session_id": session_id, "message": turn["message"], "context": turn.get("context"),
+                "idempotency_key": turn.get("idempotency_key")}
+        # Latency is measured to the result event; the HubSpot sync events that follow are not waited for
+        async with client.stream("POST", "/chat/stream", json=body) as resp:
+            resp.raise_for_status()
+            event = None
+            async for line in resp.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: ") and event == "result":
+                    return json.loads(line[6:])["reply"]
+        raise RuntimeError("no result event in stream")
+    return send, lifespan
+
+
+# ==========================================================
+# REPLAY
+# ==========================================================
+
+def _matches(expected, got, ignore_keys) -> bool:
+    if isinstance(expected, dict) and isinstance(got, dict):
+        strip = lambda d: {k: v for k, v in d.items() if k not in ignore_keys}  # noqa: E731
+        return strip(expected) == strip(got)
+    return expected == got
+
+
+async def replay(turns: Iterator[Dict], send: Callable[[Dict, str], Awaitable], speed: float = 1.0,
+                 concurrency: int = 100, prefix: str = "", window: float = 1.0,
+                 ignore_keys=IGNORE_KEYS) -> Dict:
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+    tails: Dict[str, asyncio.Task] = {}
+    samples = []            # (finished at, latency, lag)
+    mismatches, errors = [], 0
+    checked = 0
+    first_t = start = None
+
+    async def run_turn(turn: Dict, session_id: str, due: float, previous: Optional[asyncio.Task]):
+        nonlocal errors, checked
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with sem:
+            t0 = loop.time()
+            try:
+                reply = await send(turn, session_id)
+            except Exception as e:
+                errors += 1
+                reply = f"<error: {e}>"
+            finished = loop.time()
+        samples.append((finished - start, finished - t0, max(0.0, t0 - due)))
+        if "reply" in turn:
+            checked += 1
+            if not _matches(turn["reply"], reply, ignore_keys):
+                mismatches.append({"session_id": turn["session_id"], "message": turn["message"],
+                                   "expected": turn["reply"], "got": reply})
+
+    def forget(session_id: str, task: asyncio.Task):
+        if tails.get(session_id) is task:
+            del tails[session_id]
+
+    for turn in turns:
+        now = loop.time()
+        if first_t is None:
+            first_t, start = turn["t"], now
+        due = start + (turn["t"] - first_t) / speed if speed > 0 else now
+        if due > now:
+            await asyncio.sleep(due - now)
+
+        session_id = prefix + turn["session_id"]
+        task = asyncio.create_task(run_turn(turn, session_id, due, tails.get(session_id)))
+        tails[session_id] = task
+        task.add_done_callback(lambda t, sid=session_id: forget(sid, t))
+
+    if tails:
+        await asyncio.wait(list(tails.values()))
+    if not samples:
+        return {"turns": 0}
+
+    wall = max(s[0] for s in samples)
+    report = summarize([s[1] for s in samples], [])
+    report.update({
+        "turns": len(samples),
+        "speed": speed,
+        "turns_per_sec_wall": round(len(samples) / wall, 1) if wall else None,
+        "lag_p95_ms": round(sorted(s[2] for s in samples)[int(0.95 * (len(samples) - 1))] * 1000, 2),
+        "errors": errors,
+        "checked": checked,
+        "mismatches": len(mismatches),
+        "mismatch_examples": mismatches[:5],
+        "curve": _curve(samples, window),
+    })
+    return report
+
+
+def _curve(samples, window: float) -> List[Dict]:
+    """Throughput and latency per window of wall time, by completion time."""
+    buckets: Dict[int, List[float]] = {}
+    for finished, latency, _ in samples:
+        buckets.setdefault(int(finished // window), []).append(latency)
+    curve = []
+    for i in sorted(buckets):
+        stats = summarize(buckets[i], [])
+        curve.append({"t": round(i * window, 3), "turns_per_sec": round(len(buckets[i]) / window, 1),
+                      "p50_us": stats["p50_us"], "p95_us": stats["p95_us"]})
+    return curve
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", help="turn log to replay (or to write with --synthesize)")
+    parser.add_argument("--speed", type=float, default=1.0, help="N x recorded speed, 0 = no waiting")
+    parser.add_argument("--sweep", help="comma-separated speeds; prints one summary row per speed")
+    parser.add_argument("--target", choices=("brain", "http"), default="brain")
+    parser.add_argument("--url", help="live server for --target http (default: in-process app)")
+    parser.add_argument("--concurrency", type=int, default=100, help="max turns in flight")
+    parser.add_argument("--window", type=float, default=1.0, help="curve bucket in seconds")
+    parser.add_argument("--synthesize", action="store_true", help="write a log from bench/conversations.jsonl")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="new sessions per second")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        print(json.dumps({"written": synthesize(args.log, args.sessions, args.rate), "path": args.log}))
+        return
+
+    send, lifespan = brain_target() if args.target == "brain" else http_target(args.url)
+    speeds = [float(s) for s in args.sweep.split(",")] if args.sweep else [args.speed]
+
+    async def run_all():
+        reports = []
+        async with lifespan:
+            for speed in speeds:
+                skipped = [0]
+                # Fresh session ids per run so earlier runs' flow state doesn't leak in
+                report = await replay(iter_log(args.log, skipped), send, speed, args.concurrency,
+                                      prefix=f"replay{time.time_ns()}-", window=args.window)
+                report["skipped_lines"] = skipped[0]
+                reports.append(report)
+        return reports
+
+    reports = asyncio.run(run_all())
+    if args.sweep:
+        keys = ("speed", "turns", "turns_per_sec_wall", "p50_us", "p95_us", "p99_us", "lag_p95_ms", "errors", "mismatches")
+        print(json.dumps([{k: r.get(k) for k in keys} for r in reports], indent=2))
+    else:
+        print(json.dumps(reports[0], indent=2))
+
+
+if __name__ == "__main__":
+    main()
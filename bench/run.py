@@ -0,0 +1,79 @@
+"""
+Run the whole bench suite, optionally saving or comparing a baseline.
+
+    python -m bench.run --save bench/baseline.json
+    python -m bench.run --compare bench/baseline.json [--threshold 0.2]
+
+--compare exits non-zero when any p50 got slower than the threshold.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from bench import e2e, filters, intents, startup, validators
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def run_all(quick: bool = False):
+    scale = 10 if quick else 1
+    results = {}
+    results.update(filters.run(calls=2000 // scale))
+
+    intent_report = intents.run(repeat=2000 // scale)
+    results["detect_action"] = intent_report.pop("latency")
+    results["detect_action"]["accuracy"] = intent_report["accuracy"]
+    results["detect_action"]["msgs_per_sec"] = intent_report["msgs_per_sec"]
+
+    results.update(validators.run(rows=1_000_000 // scale, calls=2000 // scale))
+    results.update(e2e.run(sessions=50 // scale, calls=500 // scale))
+    results.update(startup.run(runs=max(1, 10 // scale)))
+    return results
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, stats in sorted(current.items()):
+        old = baseline.get(name)
+        if not old or not old.get("p50_us"):
+            print(f"{name:40s} {stats['p50_us']:>10.2f}us   (new)")
+            continue
+        change = stats["p50_us"] / old["p50_us"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:40s} {stats['p50_us']:>10.2f}us  {old['p50_us']:>10.2f}us  {change:+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    parser.add_argument("--quick", action="store_true", help="10x fewer iterations")
+    args = parser.parse_args()
+
+    results = run_all(args.quick)
+    report = {"commit": _git_rev(), "python": platform.python_version(), "results": results}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        sys.exit(1 if regressions else 0)
+    if not args.save:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
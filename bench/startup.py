@@ -0,0 +1,114 @@
+"""
+Cold start: how long a new app process takes to import, start up and
+answer its first requests.
+
+Every run is a fresh interpreter (imports are cached per process)
+against one database prepared up front, like an instance joining a
+deployment whose schema already exists:
+
+    python -m bench.startup [--runs 10] [--mode migrated|auto|both]
+
+"migrated" prepares the database with `python -m migrate` and starts the
+app with DB_AUTO_MIGRATE=0, the way autoscaled instances should run;
+"auto" starts it with schema checks and catalog fingerprinting at
+startup. Phases: import (import main), lifespan (startup until the
+server would accept traffic), first_chat (first POST /chat),
+first_stream (first /chat/stream turn, which touches the database) and
+process (spawn to the first /chat reply, including interpreter start
+and the bench client's own imports).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PHASES = ("import", "lifespan", "first_chat", "first_stream", "process")
+
+
+# ==========================================================
+# CHILD
+# ==========================================================
+
+async def _first_requests(app, timings):
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        timings["lifespan"] = time.perf_counter() - timings.pop("_imported")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+            t0 = time.perf_counter()
+            resp = await client.post("/chat", json={"session_id": "startup", "message": "age > 30", "context": "USERS"})
+            timings["first_chat"] = time.perf_counter() - t0
+            timings["process"] = time.time() - float(os.environ["STARTUP_BENCH_SPAWNED"])
+            resp.raise_for_status()
+
+            t0 = time.perf_counter()
+            resp = await client.post("/chat/stream", json={"session_id": "startup", "message": "start contract"})
+            timings["first_stream"] = time.perf_counter() - t0
+            resp.raise_for_status()
+
+
+def child():
+    import httpx  # noqa: F401  (the bench client's import, kept out of the app's numbers)
+
+    t0 = time.perf_counter()
+    from main import app
+    timings = {"import": time.perf_counter() - t0, "_imported": time.perf_counter()}
+    asyncio.run(_first_requests(app, timings))
+    print(json.dumps(timings))
+
+
+# ==========================================================
+# PARENT
+# ==========================================================
+
+def _env(tmp: str, mode: str):
+    return dict(
+        os.environ,
+        PYTHONPATH=str(ROOT),
+        DATABASE_URL=f"sqlite:///{tmp}/startup.db",
+        CATALOG_CACHE_PATH=f"{tmp}/catalog.json",
+        DB_AUTO_MIGRATE="0" if mode == "migrated" else "1",
+        OUTBOX_WORKER_ENABLED="0",
+        JANITOR_ENABLED="0",
+        HUBSPOT_ACCESS_TOKEN="",
+    )
+
+
+def run(runs: int = 10, mode: str = "migrated"):
+    from bench.common import summarize
+
+    samples = {phase: [] for phase in PHASES}
+    with tempfile.TemporaryDirectory(prefix="chatbot-startup-") as tmp:
+        env = _env(tmp, mode)
+        subprocess.run([sys.executable, "-m", "migrate"], env=env, cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+        for _ in range(runs):
+            env["STARTUP_BENCH_SPAWNED"] = repr(time.time())
+            out = subprocess.run([sys.executable, "-m", "bench.startup", "--child"], env=env, cwd=tmp,
+                                 check=True, capture_output=True, text=True).stdout
+            timings = json.loads(out.strip().splitlines()[-1])
+            for phase in PHASES:
+                samples[phase].append(timings[phase])
+    prefix = "startup" if mode == "migrated" else f"startup.{mode}"
+    return {f"{prefix}.{phase}": summarize(samples[phase], []) for phase in PHASES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--mode", choices=("migrated", "auto", "both"), default="both")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+    else:
+        results = {}
+        for mode in (("migrated", "auto") if args.mode == "both" else (args.mode,)):
+            results.update(run(args.runs, mode))
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,55 @@
+"""
+Validator throughput: one call per flow turn, and validate_many /
+normalize_many over a large column (bulk import).
+
+    python -m bench.validators [--rows 1000000]
+
+The vectorized path is only taken when pandas and pyarrow are installed.
+"""
+import argparse
+import json
+import random
+from bench.common import measure
+from validators import VALIDATORS, load_pandas, normalize_many, validate_many
+
+SAMPLES = {
+    "EMAIL": ["john.doe@example.com", "  Ann.Lee@Mail.co ", "not-an-email", "x@y"],
+    "NAME": ["John Doe", "Ann", "J", "R2D2"],
+    "PHONE": ["(212) 555-0100", "+44 20 7946 0958", "555-0100", "212.555.0100"],
+    "ADDRESS": ["1 Main Street", "Apt 4, Big Street", "x", "10 Downing St"],
+    "CONTRACT_ID": ["42", " 1001 ", "abc", "7"],
+}
+
+
+def column(step: str, rows: int):
+    rng = random.Random(0)
+    return [rng.choice(SAMPLES[step]) for _ in range(rows)]
+
+
+def run(rows: int = 1_000_000, calls: int = 2000):
+    results = {}
+    for step, samples in SAMPLES.items():
+        validate = VALIDATORS[step]
+        value = samples[0]
+        results[f"validate.{step.lower()}"] = measure(lambda: validate(value), calls)
+
+    for step in ("EMAIL", "PHONE"):
+        values = column(step, rows)
+        for name, fn in (("validate_many", validate_many), ("normalize_many", normalize_many)):
+            stats = measure(lambda: fn(step, values), calls=3, warmup=1, alloc_calls=0)
+            stats["rows"] = rows
+            stats["rows_per_sec"] = round(rows / (stats["mean_us"] / 1e6))
+            results[f"{name}.{step.lower()}"] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    report = {"vectorized": load_pandas() is not None, "results": run(args.rows)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
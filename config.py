@@ -3,4 +3,141 @@ from dotenv import load_dotenv
 load_dotenv()
 
 APP_NAME = "NYC Compliance Chatbot"
-VERSION = "1.0.0"
\ No newline at end of file
+VERSION = "1.0.0"
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chatbot.db")
+
+# Schema management. With DB_AUTO_MIGRATE=1 the app creates missing tables
+# and columns when it starts. Set it to 0 where a deploy step runs
+# `python -m migrate` first, so new instances start without DDL checks.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+# Load what the first requests need (column catalog, DB connection) during
+# startup, before the server accepts traffic
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+# SQLite profile
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")    # OFF | NORMAL | FULL
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64000))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # ms
+
+# Postgres (or any pooled server database) profile
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))         # seconds
+
+# Let POST /api/filter?execute=true run UPDATE filters. The endpoint is
+# unauthenticated, so keep this off unless it sits behind access control.
+FILTER_EXECUTE_UPDATES = os.getenv("FILTER_EXECUTE_UPDATES", "0") == "1"
+
+# JSONL log of locally executed filters, read by services/index_advisor.py
+# (empty = don't log)
+FILTER_USAGE_LOG = os.getenv("FILTER_USAGE_LOG", "")
+
+# Database whose tables the filter contexts are reflected from (empty =
+# DATABASE_URL), and where the compiled column catalog is cached (empty = no cache)
+CATALOG_DATABASE_URL = os.getenv("CATALOG_DATABASE_URL", "")
+CATALOG_CACHE_PATH = os.getenv("CATALOG_CACHE_PATH", "./.catalog_cache.json")
+# Use the cached catalog without checking it against the live schema. Safe
+# when schema changes only happen through `python -m migrate`, which
+# rewrites the cache; on by default when DB_AUTO_MIGRATE is off.
+CATALOG_TRUST_CACHE = os.getenv("CATALOG_TRUST_CACHE", "0" if DB_AUTO_MIGRATE else "1") == "1"
+
+# Answer count/avg/min/max filters from the running aggregates configured in
+# context_definitions (services/aggregates.py). After running with this off,
+# rebuild them: python -m services.aggregates rebuild
+AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", "1") == "1"
+
+# Worker processes used by /api/filter/batch for large batches (1 = in-process).
+# Every app process (and every shard worker) gets its own pool, so keep it small.
+FILTER_BATCH_WORKERS = int(os.getenv("FILTER_BATCH_WORKERS", min(2, os.cpu_count() or 1)))
+# Most items one /api/filter/batch request may carry
+FILTER_BATCH_MAX_ITEMS = int(os.getenv("FILTER_BATCH_MAX_ITEMS", 5000))
+
+# In-process chat session cache (services/memory.py)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 900))
+# A cached session is checked against its latest event id in the database
+# before every turn, so several app processes can serve the same session.
+# Set to 0 only when each session always lands on the same process.
+SESSION_CACHE_VERIFY = os.getenv("SESSION_CACHE_VERIFY", "1") == "1"
+# Session state changes are appended to chat_session_events; every this
+# many events the state is snapshotted back into chat_sessions
+SESSION_SNAPSHOT_EVERY = int(os.getenv("SESSION_SNAPSHOT_EVERY", 20))
+# chat_sessions.last_active_at is written at most this often per session (seconds)
+SESSION_ACTIVITY_RESOLUTION = float(os.getenv("SESSION_ACTIVITY_RESOLUTION", 300))
+
+# Session janitor (services/janitor.py): sessions idle longer than
+# SESSION_IDLE_TTL are deleted, with their events, in batches of
+# JANITOR_BATCH_SIZE. Each deleted session is first appended to
+# JANITOR_ARCHIVE_PATH (NDJSON) if set. ANALYZE / VACUUM runs every
+# JANITOR_COMPACT_INTERVAL; on SQLite, VACUUM only runs when at least
+# JANITOR_VACUUM_FREE_RATIO of the file is free pages.
+JANITOR_ENABLED = os.getenv("JANITOR_ENABLED", "1") == "1"
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 7 * 86400))   # seconds
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", 3600))        # seconds between sweeps
+JANITOR_BATCH_SIZE = int(os.getenv("JANITOR_BATCH_SIZE", 500))
+JANITOR_BATCH_PAUSE = float(os.getenv("JANITOR_BATCH_PAUSE", 0.05))  # seconds between batches
+JANITOR_ARCHIVE_PATH = os.getenv("JANITOR_ARCHIVE_PATH", "")
+JANITOR_COMPACT_INTERVAL = float(os.getenv("JANITOR_COMPACT_INTERVAL", 86400))
+JANITOR_VACUUM_FREE_RATIO = float(os.getenv("JANITOR_VACUUM_FREE_RATIO", 0.25))
+
+# HubSpot API. Without an access token the client answers with canned
+# responses so local development works offline.
+HUBSPOT_BASE_URL = os.getenv("HUBSPOT_BASE_URL", "https://api.hubapi.com")
+HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN", "")
+HUBSPOT_TIMEOUT = float(os.getenv("HUBSPOT_TIMEOUT", 10))
+HUBSPOT_MAX_CONNECTIONS = int(os.getenv("HUBSPOT_MAX_CONNECTIONS", 20))
+HUBSPOT_RATE_LIMIT = float(os.getenv("HUBSPOT_RATE_LIMIT", 10))       # requests / second
+HUBSPOT_RATE_BURST = int(os.getenv("HUBSPOT_RATE_BURST", 20))
+HUBSPOT_MAX_RETRIES = int(os.getenv("HUBSPOT_MAX_RETRIES", 4))
+HUBSPOT_BATCH_SIZE = int(os.getenv("HUBSPOT_BATCH_SIZE", 100))        # HubSpot batch API limit
+HUBSPOT_BATCH_WINDOW = float(os.getenv("HUBSPOT_BATCH_WINDOW", 0.05))  # seconds
+
+# HubSpot outbox worker (services/outbox.py)
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "1") == "1"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))   # seconds
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 60))                    # seconds
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+
+# How long a streamed chat turn waits for the HubSpot sync before
+# reporting it as still pending
+STREAM_SYNC_WAIT = float(os.getenv("STREAM_SYNC_WAIT", 10))
+
+# Sharded deployment (services/sharding.py). SHARD_COUNT > 1 runs one
+# worker process per shard behind a front router; each worker keeps its
+# sessions' chat_sessions rows in its own SESSION_SHARD_URL database.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_INDEX = int(os.environ["SHARD_INDEX"]) if os.getenv("SHARD_INDEX") else None
+SHARD_HOST = os.getenv("SHARD_HOST", "127.0.0.1")
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 8100))
+SESSION_SHARD_URL = os.getenv("SESSION_SHARD_URL", "sqlite:///./chatbot.shard{shard}.db")
+
+# Instrumentation (services/metrics.py). With METRICS_ENABLED=0 spans and
+# counters compile down to no-ops. Profiling only happens when PROFILE_DIR
+# is set and a request carries the PROFILE_HEADER.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 1.0))
+
+# Bulk contract import (services/bulk.py): rows validated and inserted per batch
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+
+# Country code given to 10-digit phone numbers when normalizing to E.164
+PHONE_DEFAULT_COUNTRY_CODE = os.getenv("PHONE_DEFAULT_COUNTRY_CODE", "1")
+
+# Idempotent chat turns (services/idempotency.py)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))  # replies kept in memory
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 86400))              # seconds a key is honoured
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", 30))               # max wait on an in-flight duplicate
+# Seconds after which a claimed key with no reply is taken to belong to a
+# dead turn and may be claimed again; keep it above the longest turn
+IDEMPOTENCY_CLAIM_TIMEOUT = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", 120))
+
+# Append every chat turn (time, session, message, reply) to this JSONL
+# file for bench/replay.py. Empty = off.
+CHAT_RECORD_LOG = os.getenv("CHAT_RECORD_LOG", "")
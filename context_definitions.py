@@ -1,3 +1,13 @@
+# Filter contexts: the table behind each one and the synonyms people use
+# for its columns. Columns and types are reflected from the table by
+# services/catalog.py; `columns` here is only the fallback for a table
+# that is neither in the catalog database nor in our models. `exclude`
+# lists columns that must never be filtered on or updated.
+#
+# `aggregates` keeps running counts, sums and min/max of the (integer)
+# `columns`, for the whole table and per value of each `group_by` column,
+# so count/avg/min/max filters on them skip the table scan
+# (services/aggregates.py).
 AVAILABLE_CONTEXTS = {
     "USERS": {
         "table_name": "users",
@@ -7,23 +17,35 @@ AVAILABLE_CONTEXTS = {
             "email": {"type": "STRING"},
             "age": {"type": "INTEGER"},
             "status": {"type": "STRING"},
-        }
+        },
+        "synonyms": {
+            "id": ["user id"],
+            "name": ["full name", "user name"],
+            "email": ["e-mail", "email address"],
+        },
     },
     "CONTRACTS": {
         "table_name": "contracts",
-        "columns": {
-            "id": {"type": "INTEGER"},
-            "email": {"type": "STRING"},
-            "name": {"type": "STRING"},
-            "phone": {"type": "STRING"},
-            "address": {"type": "STRING"},
-            "status": {"type": "STRING"},
-        }
-    }
+        "synonyms": {
+            "id": ["contract id"],
+            "name": ["full name", "customer name"],
+            "email": ["e-mail", "email address"],
+            "phone": ["phone number", "telephone", "mobile"],
+            "address": ["street address"],
+        },
+        # Links to the owning chat session (row id in its shard)
+        "exclude": ["session_id", "session_shard"],
+        "aggregates": {"group_by": ["status"], "columns": ["id"]},
+    },
 }
 
 def get_context_info(key: str):
-    return AVAILABLE_CONTEXTS.get(key.upper())
+    from services.catalog import get_catalog
+
+    catalog = get_catalog(key)
+    if catalog is None:
+        return None
+    return {"table_name": catalog.table_name, "columns": catalog.columns}
 
 def list_available_contexts():
     return list(AVAILABLE_CONTEXTS.keys())
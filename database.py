@@ -1,19 +1,127 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.schema import CreateColumn
+from config import (
+    DATABASE_URL, SQLITE_WAL, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+)
 
-DATABASE_URL = "sqlite:///./chatbot.db"
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def normalize_url(url: str) -> str:
+    """Heroku-style postgres:// URLs, which SQLAlchemy no longer accepts, as postgresql://."""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def async_url(url: str) -> str:
+    """`url` with its backend's async driver, whatever sync driver it names (sqlite+pysqlite://...)."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def _sqlite_pragmas(wal: bool):
+    def on_connect(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        if wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    return on_connect
+
+
+def create_engines(url: str = DATABASE_URL, wal: bool = SQLITE_WAL):
+    """
+    Build the sync and async engines for `url` with the matching profile:
+    SQLite gets WAL, tuned pragmas and a busy timeout; server databases
+    get a sized pool with pre-ping and connection recycling.
+    """
+    url = normalize_url(url)
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000}
+        )
+        async_engine = create_async_engine(
+            async_url(url), connect_args={"timeout": SQLITE_BUSY_TIMEOUT / 1000}
+        )
+        on_connect = _sqlite_pragmas(wal)
+        event.listen(engine, "connect", on_connect)
+        event.listen(async_engine.sync_engine, "connect", on_connect)
+    else:
+        pool = dict(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+        engine, async_engine = create_engine(url, **pool), create_async_engine(async_url(url), **pool)
+    return engine, async_engine
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+engine, async_engine = create_engines()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
+def add_missing_columns(bind, tables=None):
+    """
+    create_all() never alters a table that already exists. Add the
+    columns models gained since (plus indexes on them) so older databases
+    keep working. Only nullable / defaulted columns can be added this way.
+    """
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    for table in tables if tables is not None else Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        have = {c["name"] for c in inspector.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in have]
+        if not missing:
+            continue
+        with bind.begin() as conn:
+            for column in missing:
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        names = {c.name for c in missing}
+        for index in table.indexes:
+            if names & {c.name for c in index.columns}:
+                index.create(bind, checkfirst=True)
+
+
+def migrate(bind=None):
+    """Create missing tables and columns (`python -m migrate`, or at startup with DB_AUTO_MIGRATE)."""
+    import models  # noqa: F401  (registers tables on Base)
+
+    bind = bind if bind is not None else engine
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
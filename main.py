@@ -1,11 +1,62 @@
+from contextlib import asynccontextmanager
+import anyio
 from fastapi import FastAPI
-from database import Base, engine
+from config import DB_AUTO_MIGRATE, JANITOR_ENABLED, OUTBOX_WORKER_ENABLED, SHARD_INDEX, STARTUP_WARMUP
+from database import async_engine, migrate
 from routes.chat import router as chat_router
+from routes.contracts import router as contracts_router
 from routes.filters import router as filter_router
+from routes.metrics import router as metrics_router
+from services import janitor, metrics, outbox
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Chatbot with Contracts & SQL Filters")
+async def warm_up():
+    """
+    Load what the first requests would otherwise pay for: the filter
+    builders and their column catalog (the prebuilt cache, when trusted),
+    a pooled database connection and anyio's event loop backend.
+    """
+    from context_definitions import list_available_contexts
+    from services.filter_builder import get_filter_builder
+
+    for key in list_available_contexts():
+        get_filter_builder(key)
+    async with async_engine.connect():
+        pass
+    await anyio.sleep(0)
+
+
+# Without DB_AUTO_MIGRATE the schema is managed by `python -m migrate`
+if DB_AUTO_MIGRATE:
+    migrate()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STARTUP_WARMUP:
+        await warm_up()
+    if OUTBOX_WORKER_ENABLED:
+        outbox.start_worker()
+    if JANITOR_ENABLED:
+        janitor.start()
+    yield
+    await janitor.stop()
+    await outbox.stop_worker()
+    # The HubSpot client and the filter builder are imported on first use
+    from services.tools.hubspot import close_client
+    from services.filter_builder import shutdown_batch_pool
+    await close_client()
+    await anyio.to_thread.run_sync(shutdown_batch_pool)
+
+
+app = FastAPI(title="Chatbot with Contracts & SQL Filters", lifespan=lifespan)
+
+metrics.install(app)
+if SHARD_INDEX is not None:
+    from services import sharding
+    sharding.configure_worker(app)
 
 app.include_router(chat_router)
 app.include_router(filter_router, prefix="/api")
+app.include_router(contracts_router, prefix="/api")
+app.include_router(metrics_router)
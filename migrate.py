@@ -0,0 +1,69 @@
+"""
+Deploy step that prepares the database and the startup artifacts, so that
+app instances started with DB_AUTO_MIGRATE=0 do no DDL or reflection of
+their own:
+
+    python -m migrate [--skip-aggregates]
+
+- creates missing tables and columns in DATABASE_URL and, with
+  SHARD_COUNT > 1, in every shard's session database
+- builds the running aggregates (services/aggregates.py) that have never
+  been built, so no request pays for the first full scan
+- writes the column catalog to CATALOG_CACHE_PATH; instances with
+  CATALOG_TRUST_CACHE load it without querying the schema
+
+Run it again after every schema or context definition change.
+"""
+import argparse
+import asyncio
+import json
+import time
+from config import CATALOG_CACHE_PATH, SESSION_SHARD_URL, SHARD_COUNT
+
+
+async def _build_aggregates():
+    from database import AsyncSessionLocal, Base
+    from services import aggregates
+
+    built = []
+    async with AsyncSessionLocal() as db:
+        for name in sorted(aggregates.SPECS):
+            if await aggregates.ensure_built(db, Base.metadata.tables[name]):
+                built.append(name)
+        await db.commit()
+    return built
+
+
+def run(skip_aggregates: bool = False):
+    from database import create_engines, migrate
+    from services import catalog, sharding
+
+    started = time.perf_counter()
+    report = {}
+    migrate()
+
+    if SHARD_COUNT > 1:
+        for shard in range(SHARD_COUNT):
+            engine = create_engines(SESSION_SHARD_URL.format(shard=shard))[0]
+            sharding.migrate_shard(engine)
+            engine.dispose()
+        report["shards"] = SHARD_COUNT
+
+    if not skip_aggregates:
+        report["aggregates_built"] = asyncio.run(_build_aggregates())
+
+    # Checked against the live schema, and rewritten if it changed
+    report["catalog"] = {"path": CATALOG_CACHE_PATH, "contexts": sorted(catalog.load_catalog(trust_cache=False))}
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skip-aggregates", action="store_true", help="leave unbuilt aggregates to their first use")
+    args = parser.parse_args()
+    print(json.dumps(run(args.skip_aggregates), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, JSON
+from datetime import datetime
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Text, ForeignKey, JSON, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -10,19 +11,104 @@ class ChatSession(Base):
     action = Column(String, nullable=True)
     step = Column(String, nullable=True)
     data = Column(JSON, default={})
+    # Bumped at most every SESSION_ACTIVITY_RESOLUTION; the janitor expires idle sessions by it
+    last_active_at = Column(DateTime, default=datetime.utcnow, nullable=True, index=True)
 
-    contracts = relationship("Contract", back_populates="session")
+    contracts = relationship("Contract", back_populates="session",
+                             primaryjoin="ChatSession.id == foreign(Contract.session_id)")
+
+
+class SessionEvent(Base):
+    """
+    Append-only log of chat session state changes. The action/step/data
+    columns of ChatSession are a snapshot; the session's current state
+    is that snapshot plus the events after its latest "snapshot" marker
+    (see services/memory.py).
+    """
+    __tablename__ = "chat_session_events"
+    __table_args__ = (Index("ix_chat_session_events_session_id_id", "session_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"))
+    kind = Column(String)              # set | move | reset | snapshot
+    action = Column(String, nullable=True)
+    step = Column(String, nullable=True)
+    field = Column(String, nullable=True)
+    value = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Contract(Base):
     __tablename__ = "contracts"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"))
+    # Not a foreign key: in sharded mode it is a row id in the shard's own
+    # database (services/sharding.py), recorded in session_shard
+    session_id = Column(Integer)
+    # Shard whose database holds session_id (sharded mode only; NULL otherwise)
+    session_shard = Column(Integer, nullable=True)
     email = Column(String)
     name = Column(String)
     phone = Column(String)
     address = Column(Text)
     status = Column(String, default="PENDING")
 
-    session = relationship("ChatSession", back_populates="contracts")
+    session = relationship("ChatSession", back_populates="contracts",
+                           primaryjoin="foreign(Contract.session_id) == ChatSession.id")
+
+
+class OutboxEvent(Base):
+    """
+    Pending HubSpot sync, committed in the same transaction as the
+    contract change it belongs to and drained by services/outbox.py
+    """
+    __tablename__ = "hubspot_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
+    operation = Column(String)
+    payload = Column(JSON, default={})
+    status = Column(String, default="PENDING", index=True)
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=datetime.utcnow, index=True)
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+
+class ChatReply(Base):
+    """
+    Stored reply for a (session_id, idempotency_key) pair, so a retried
+    chat message is answered without running the turn again. The row is
+    claimed (reply NULL, claimed_at set) before the turn starts.
+    """
+    __tablename__ = "chat_replies"
+    __table_args__ = (UniqueConstraint("session_id", "idempotency_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String)
+    idempotency_key = Column(String)
+    reply = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claimed_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+
+
+class FilterAggregate(Base):
+    """
+    Running count / sum / min / max of one column ("*" = rows) over a table,
+    or over the rows where `group_column` equals `group_value` ("" = whole
+    table). Maintained by services/aggregates.py in the same transaction as
+    the rows it summarizes; `stale` means min/max must be recomputed.
+    """
+    __tablename__ = "filter_aggregates"
+    __table_args__ = (UniqueConstraint("table_name", "group_column", "group_value", "column"),)
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String)
+    group_column = Column(String)
+    group_value = Column(String)
+    column = Column(String)
+    count = Column(BigInteger, default=0)
+    total = Column(BigInteger, default=0)
+    min_value = Column(BigInteger, nullable=True)
+    max_value = Column(BigInteger, nullable=True)
+    stale = Column(Boolean, default=False)
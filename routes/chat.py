@@ -1,18 +1,22 @@
 # chat.py
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from schemas import ChatRequest, ChatResponse
-from services.filter_builder import build_filter  # import your FilterBuilder wrapper
+from services.brain import stream_message
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
     message = request.message
     context = request.context
 
-    # Use FilterBuilder to parse the message
+    # Use FilterBuilder to parse the message (imported on first use, see main.warm_up)
+    from services.filter_builder import build_filter
     try:
         filter_result = build_filter(context, message)
         if "error" in filter_result:
@@ -23,3 +27,39 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
         reply = f"Error: {str(e)}"
 
     return {"reply": reply}
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Server-Sent Events: ack, progress, result, then HubSpot sync status.
+    The idempotency key may come in the body or an Idempotency-Key header.
+    """
+    key = request.idempotency_key or idempotency_key
+
+    async def events():
+        # The stream outlives the request, so it opens its own session
+        async with AsyncSessionLocal() as db:
+            async for event in stream_message(db, request.session_id, request.message, request.context, key):
+                yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/chat/ws/{session_id}")
+async def chat_ws(websocket: WebSocket, session_id: str):
+    """
+    One long-lived socket per chat session. Each {"message", "context",
+    "idempotency_key"} frame runs a turn and streams the same events as /chat/stream.
+    """
+    await websocket.accept()
+    async with AsyncSessionLocal() as db:
+        try:
+            while True:
+                frame = await websocket.receive_json()
+                async for event in stream_message(db, session_id, frame.get("message", ""), frame.get("context"),
+                                                  frame.get("idempotency_key")):
+                    await websocket.send_text(json.dumps(event, default=str))
+        except WebSocketDisconnect:
+            pass
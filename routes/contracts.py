@@ -0,0 +1,49 @@
+import json
+import tempfile
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from config import BULK_BATCH_SIZE
+from database import AsyncSessionLocal
+from services.bulk import export_contracts, iter_lines, iter_records, run_import
+
+router = APIRouter()
+
+
+@router.post("/contracts/bulk")
+async def bulk_import(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=10000),
+    sync: bool = True,
+):
+    """
+    Body is CSV (with header) or NDJSON, chosen by Content-Type. The reply
+    is NDJSON: one line per rejected row, then a {"summary": ...} line.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+
+    # The body has to be consumed before the response starts, so rejects
+    # are spooled to a temp file instead of being held in memory
+    rejects = tempfile.TemporaryFile("w+")
+    async with AsyncSessionLocal() as db:
+        records = iter_records(iter_lines(request.stream()), fmt)
+        totals = await run_import(db, records, rejects, batch_size, sync)
+    rejects.seek(0)
+
+    def report():
+        with rejects:
+            yield from rejects
+        yield json.dumps({"summary": totals}) + "\n"
+
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
+
+@router.get("/contracts/export")
+async def bulk_export(format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    async def rows():
+        async with AsyncSessionLocal() as db:
+            async for text in export_contracts(db, format):
+                yield text
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(rows(), media_type=media_type)
@@ -1,12 +1,73 @@
-from fastapi import APIRouter, HTTPException
-from schemas import FilterRequest, FilterResponse
-from services.filter_builder import build_filter
+import json
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from config import FILTER_EXECUTE_UPDATES
+from database import AsyncSessionLocal
+from schemas import FilterRequest, FilterResponse, FilterBatchRequest, FilterBatchResponse
 
 router = APIRouter()
 
-@router.post("/filter", response_model=FilterResponse)
-def create_filter(req: FilterRequest):
+
+def _wants_ndjson(accept: Optional[str]) -> bool:
+    return bool(accept) and "application/x-ndjson" in accept
+
+
+@router.post("/filter", response_model=FilterResponse, response_model_exclude_none=True)
+async def create_filter(
+    req: FilterRequest,
+    execute: bool = False,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    accept: Optional[str] = Header(None),
+):
+    # The filter stack loads on first use (or in main.warm_up), not at app import
+    from services.filter_builder import build_filter
+    from services.query_executor import compile_filter, execute_filter
+
     result = build_filter(req.context, req.query)
     if "error" in result:
         raise HTTPException(400, result["error"])
-    return {"supabase_query": result.get("supabase_query", "")}
+    if not execute:
+        return {"supabase_query": result.get("supabase_query", "")}
+
+    try:
+        # Compiled up front so bad queries get a 400 before any database work
+        q, _ = compile_filter(req.context, req.query)
+        if q.kind == "update" and not FILTER_EXECUTE_UPDATES:
+            raise HTTPException(403, "Executing UPDATE filters is disabled (FILTER_EXECUTE_UPDATES)")
+        if _wants_ndjson(accept):
+            if q.kind == "update":
+                raise ValueError("UPDATE queries cannot be streamed")
+            return StreamingResponse(_stream_rows(req.context, req.query), media_type="application/x-ndjson")
+        async with AsyncSessionLocal() as db:
+            page = await execute_filter(db, req.context, req.query, limit, offset)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"supabase_query": result.get("supabase_query", ""), **page}
+
+
+async def _stream_rows(context: str, query: str):
+    from services.query_executor import stream_filter
+
+    # The stream outlives the request-scoped session, so it opens its own
+    async with AsyncSessionLocal() as db:
+        async for row in stream_filter(db, context, query):
+            yield json.dumps(row, default=str) + "\n"
+
+
+@router.post("/filter/batch", response_model=FilterBatchResponse)
+async def create_filter_batch(req: FilterBatchRequest, accept: Optional[str] = Header(None)):
+    from services.filter_builder import build_filter_batch
+
+    results = build_filter_batch([(item.context, item.query) for item in req.items])
+
+    # Stream one JSON object per line when the client asks for NDJSON.
+    # Both paths consume the generator off the event loop.
+    if _wants_ndjson(accept):
+        return StreamingResponse(
+            (json.dumps(r) + "\n" for r in results),
+            media_type="application/x-ndjson",
+        )
+    return {"results": await run_in_threadpool(list, results)}
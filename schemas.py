@@ -1,10 +1,15 @@
-from pydantic import BaseModel
-from typing import Optional, Union, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, Union, Dict, List
+from config import FILTER_BATCH_MAX_ITEMS
 
 class ChatRequest(BaseModel):
     session_id: str
     message: str
     context: Optional[str] = None
+    # Retries with the same key get the stored reply instead of a second turn
+    idempotency_key: Optional[str] = Field(
+        None, description="Honoured by /chat/stream and /chat/ws; ignored by POST /chat, which has no side effects",
+    )
 
 class ChatResponse(BaseModel):
     reply: Union[str, Dict]
@@ -15,3 +20,18 @@ class FilterRequest(BaseModel):
 
 class FilterResponse(BaseModel):
     supabase_query: str
+    # only set when the filter is executed locally (?execute=true)
+    rows: Optional[List[Dict]] = None
+    next_offset: Optional[int] = None
+    rowcount: Optional[int] = None
+
+
+class FilterBatchRequest(BaseModel):
+    items: List[FilterRequest] = Field(..., max_length=FILTER_BATCH_MAX_ITEMS)
+
+class FilterBatchResult(BaseModel):
+    supabase_query: Optional[str] = None
+    error: Optional[str] = None
+
+class FilterBatchResponse(BaseModel):
+    results: List[FilterBatchResult]
@@ -1,32 +1,118 @@
-def detect_action(message: str):
-    msg = message.lower().strip()
+import re
+from typing import Dict, List, Tuple
+from services.metrics import timed
+
+# ==========================================================
+# INTENT VOCABULARY
+# ==========================================================
+# phrase -> weight. An intent's score is the total weight of its phrases
+# in the message. Intents are tried in INTENT_PRIORITY order and the first
+# whose score reaches CONFIDENCE_THRESHOLD wins; otherwise REJECT.
 
+INTENT_PHRASES: Dict[str, Dict[str, float]] = {
     # ---------- CONTRACT FLOWS ----------
-    if any(k in msg for k in ["start contract", "new contract", "create contract"]):
-        return "START_CONTRACT"
+    "START_CONTRACT": {
+        "start contract": 3.0,
+        "new contract": 3.0,
+        "create contract": 3.0,
+        "start a contract": 3.0,
+        "create a contract": 3.0,
+    },
+    "UPDATE_PHONE": {
+        "update phone": 3.0,
+        "change phone": 3.0,
+        "update my phone": 3.0,
+        "change my phone": 3.0,
+        "update phone number": 3.0,
+        "change phone number": 3.0,
+    },
+    # ---------- FILTER / QUERY ----------
+    "CREATE_FILTER": {
+        "filter": 1.0,
+        "query": 1.0,
+        "show": 1.0,
+        "list": 1.0,
+        "give me": 1.0,
+        "get": 1.0,
+        "find": 1.0,
+        "where": 1.0,
+        "=": 1.0,
+        "<": 1.0,
+        ">": 1.0,
+        "equals": 1.0,
+        "between": 1.0,
+        "greater than": 1.0,
+        "less than": 1.0,
+        "how many": 1.0,
+        "count": 1.0,
+        # too common to decide on their own
+        "with": 0.5,
+        "is": 0.5,
+    },
+    # ---------- UPDATE QUERY ----------
+    "UPDATE_FILTER": {
+        "update": 1.0,
+        "set": 1.0,
+        "change": 1.0,
+        "modify": 1.0,
+    },
+}
 
-    if any(k in msg for k in ["update phone", "change phone"]):
-        return "UPDATE_PHONE"
+# Same strict precedence as the old keyword cascade: a contract flow phrase
+# wins over any number of filter words ("start contract and show list where ...")
+INTENT_PRIORITY = ["START_CONTRACT", "UPDATE_PHONE", "CREATE_FILTER", "UPDATE_FILTER"]
 
-    # ---------- FILTER / QUERY ----------
-    if any(k in msg for k in [
-        "filter",
-        "query",
-        "show",
-        "list",
-        "give me",
-        "get",
-        "find",
-        "with",
-        "where",
-        "=",
-        "equals",
-        "is"
-    ]):
-        return "CREATE_FILTER"
+CONFIDENCE_THRESHOLD = 1.0
+
+WORD_RE = re.compile(r"[a-z0-9_]+|[=<>]")
+
+_END = ""   # trie key marking the end of a phrase
 
-    # ---------- UPDATE QUERY ----------
-    if any(w in msg for w in ["update", "set", "change", "modify"]):
-        return "UPDATE_FILTER"
 
+def _build_trie(phrases: Dict[str, Dict[str, float]]) -> Dict:
+    """Token trie: each node maps a word to a child; _END holds (intent, weight)."""
+    trie: Dict = {}
+    for intent, vocabulary in phrases.items():
+        for phrase, weight in vocabulary.items():
+            node = trie
+            for word in WORD_RE.findall(phrase):
+                node = node.setdefault(word, {})
+            node[_END] = (intent, weight)
+    return trie
+
+
+_TRIE = _build_trie(INTENT_PHRASES)
+
+
+def score_intents(message: str) -> Dict[str, float]:
+    """
+    Longest-match scan of the message over the phrase trie. Work per
+    word is bounded by the longest phrase, not by the vocabulary size.
+    """
+    words: List[str] = WORD_RE.findall(message.lower())
+    scores: Dict[str, float] = {}
+    i = 0
+    while i < len(words):
+        node = _TRIE
+        match: Tuple = ()
+        j = i
+        while j < len(words) and words[j] in node:
+            node = node[words[j]]
+            j += 1
+            if _END in node:
+                match = (j, node[_END])
+        if match:
+            i, (intent, weight) = match
+            scores[intent] = scores.get(intent, 0.0) + weight
+        else:
+            i += 1
+    return scores
+
+
+@timed("detect_action")
+def detect_action(message: str):
+    scores = score_intents(message)
+    for intent in INTENT_PRIORITY:
+        if scores.get(intent, 0.0) >= CONFIDENCE_THRESHOLD:
+            return intent
     return "REJECT"
@@ -0,0 +1,409 @@
+"""
+Running aggregates for count/avg/min/max filters.
+
+For every context with an `aggregates` entry in AVAILABLE_CONTEXTS, the
+filter_aggregates table holds the row count and the count, sum, min and
+max of each configured column: once for the whole table and once per
+value of every `group_by` column. A count/avg/min/max filter with no
+WHERE, or with a single `<group column> = value`, is answered from one
+row of it instead of a scan.
+
+Writers keep it current inside their own transaction:
+track_inserts() after inserting rows, update_where() in place of an
+UPDATE on a tracked table. Counts and sums are applied as deltas, so
+concurrent writers never overwrite each other. Min/max only move
+outwards on insert; when a row holding the current min or max leaves a
+group the row is marked stale, and min/max are recomputed for that
+group the next time they are asked for.
+
+The aggregates of a table are built from a full scan the first time
+they are used (or by `rebuild`), and a marker row records that they
+are complete. Rows whose group value is NULL are left out of that
+group's aggregates, like `= NULL` matches nothing in SQL.
+
+    python -m services.aggregates check [--table contracts]
+    python -m services.aggregates rebuild [--table contracts]
+
+`check` recomputes everything from the table and reports differences;
+`rebuild` replaces the stored aggregates with the recomputed ones.
+"""
+import argparse
+import asyncio
+import json
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import BigInteger, Table, and_, bindparam, case, delete, func, or_, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import AGGREGATES_ENABLED
+from context_definitions import AVAILABLE_CONTEXTS
+from models import FilterAggregate
+from services.metrics import inc
+
+AGGREGATES = FilterAggregate.__table__
+ROWS = "*"                 # `column` of the row count
+WHOLE_TABLE = ""           # group_column / group_value of the table-wide aggregates
+KINDS = ("count", "avg", "min", "max")
+MISSING = object()
+
+Key = Tuple[str, str, str]  # (group_column, group_value, column)
+
+
+class AggregateSpec(NamedTuple):
+    table: str
+    group_by: Tuple[str, ...]
+    columns: Tuple[str, ...]
+
+    @property
+    def tracked(self) -> set:
+        return set(self.group_by) | set(self.columns)
+
+
+SPECS: Dict[str, AggregateSpec] = {
+    d["table_name"]: AggregateSpec(d["table_name"], tuple(d["aggregates"].get("group_by", ())),
+                                   tuple(d["aggregates"].get("columns", ())))
+    for d in AVAILABLE_CONTEXTS.values() if d.get("aggregates")
+}
+
+_built: set = set()        # tables whose marker row this process has seen
+
+
+def _spec(table: Table) -> Optional[AggregateSpec]:
+    return SPECS.get(table.name) if AGGREGATES_ENABLED else None
+
+
+def _value(row, column: str):
+    return row[column] if hasattr(row, "keys") else getattr(row, column)
+
+
+def _entries(spec: AggregateSpec, row) -> Dict[Key, object]:
+    """Every aggregate `row` counts towards, with the value it adds (1 for row counts)."""
+    entries = {}
+    for group_column in (WHOLE_TABLE,) + spec.group_by:
+        if group_column:
+            group_value = _value(row, group_column)
+            if group_value is None:
+                continue
+            group_value = str(group_value)
+        else:
+            group_value = WHOLE_TABLE
+        entries[(group_column, group_value, ROWS)] = 1
+        for column in spec.columns:
+            value = _value(row, column)
+            if value is not None:
+                entries[(group_column, group_value, column)] = value
+    return entries
+
+
+# ==========================================================
+# DELTAS
+# ==========================================================
+
+class Deltas:
+    """Changes to apply per aggregate: count, total, new min/max, removed min/max."""
+
+    def __init__(self):
+        self.items: Dict[Key, List] = {}
+
+    def _item(self, key: Key) -> List:
+        return self.items.setdefault(key, [0, 0, None, None, None, None])
+
+    def add(self, key: Key, value):
+        d = self._item(key)
+        d[0] += 1
+        if key[2] != ROWS:
+            d[1] += value
+            d[2] = value if d[2] is None else min(d[2], value)
+            d[3] = value if d[3] is None else max(d[3], value)
+
+    def remove(self, key: Key, value):
+        d = self._item(key)
+        d[0] -= 1
+        if key[2] != ROWS:
+            d[1] -= value
+            d[4] = value if d[4] is None else min(d[4], value)
+            d[5] = value if d[5] is None else max(d[5], value)
+
+    def insert(self, spec: AggregateSpec, row):
+        for key, value in _entries(spec, row).items():
+            self.add(key, value)
+
+    def change(self, spec: AggregateSpec, old, new):
+        """Move a row from `old` to `new` values; aggregates it stays in unchanged are not touched."""
+        before, after = _entries(spec, old), _entries(spec, new)
+        for key, value in before.items():
+            if after.get(key, MISSING) != value:
+                self.remove(key, value)
+        for key, value in after.items():
+            if before.get(key, MISSING) != value:
+                self.add(key, value)
+
+
+@lru_cache(maxsize=None)
+def _upsert(dialect: str):
+    # Imported here: loading the postgresql dialect is a noticeable part of app startup
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(AGGREGATES)
+    new, agg = stmt.excluded, AGGREGATES.c
+    removed_min = bindparam("removed_min", type_=BigInteger)
+    removed_max = bindparam("removed_max", type_=BigInteger)
+    # SET expressions all see the row as it was before this statement
+    return stmt.on_conflict_do_update(
+        index_elements=[agg.table_name, agg.group_column, agg.group_value, agg.column],
+        set_={
+            "count": agg["count"] + new["count"],
+            "total": agg.total + new.total,
+            "min_value": case(
+                (and_(new.min_value.isnot(None), or_(agg.min_value.is_(None), new.min_value < agg.min_value)),
+                 new.min_value),
+                else_=agg.min_value,
+            ),
+            "max_value": case(
+                (and_(new.max_value.isnot(None), or_(agg.max_value.is_(None), new.max_value > agg.max_value)),
+                 new.max_value),
+                else_=agg.max_value,
+            ),
+            # Removing a value at or past the current extreme may have removed the extreme itself
+            "stale": or_(agg.stale, func.coalesce(removed_min <= agg.min_value, False),
+                         func.coalesce(removed_max >= agg.max_value, False)),
+        },
+    )
+
+
+async def _apply(db: AsyncSession, spec: AggregateSpec, deltas: Deltas):
+    params = [
+        {"table_name": spec.table, "group_column": key[0], "group_value": key[1], "column": key[2],
+         "count": d[0], "total": d[1], "min_value": d[2], "max_value": d[3], "stale": False,
+         "removed_min": d[4], "removed_max": d[5]}
+        for key, d in deltas.items.items()
+        if d[0] or d[1] or d[2] is not None or d[4] is not None
+    ]
+    if params:
+        dialect = db.get_bind(FilterAggregate).dialect.name
+        await db.execute(_upsert(dialect), params)
+        inc("aggregate_updates_total", len(params), table=spec.table)
+
+
+# ==========================================================
+# WRITERS
+# ==========================================================
+
+async def track_inserts(db: AsyncSession, table: Table, rows: Iterable):
+    """Count freshly inserted rows (mappings or ORM objects), before the transaction commits."""
+    spec = _spec(table)
+    if spec is None:
+        return
+    # A first-time build scans the table, new rows included
+    if await ensure_built(db, table):
+        return
+    deltas = Deltas()
+    for row in rows:
+        deltas.insert(spec, row)
+    await _apply(db, spec, deltas)
+
+
+async def update_where(db: AsyncSession, table: Table, where, values: Dict) -> int:
+    """UPDATE `table` SET `values` WHERE `where`, keeping its aggregates in step; returns the rowcount."""
+    stmt = update(table).where(where).values(**values)
+    spec = _spec(table)
+    changed = spec.tracked & values.keys() if spec is not None else None
+    if not changed:
+        return (await db.execute(stmt)).rowcount
+
+    await ensure_built(db, table)
+    columns = sorted(spec.tracked)
+    before = (await db.execute(
+        select(*(table.c[c] for c in columns)).where(where).with_for_update()
+    )).mappings().all()
+    result = await db.execute(stmt)
+
+    deltas = Deltas()
+    for row in before:
+        deltas.change(spec, row, {**row, **{c: values[c] for c in changed}})
+    await _apply(db, spec, deltas)
+    return result.rowcount
+
+
+# ==========================================================
+# BUILD / CHECK
+# ==========================================================
+
+async def _compute(db: AsyncSession, table: Table, spec: AggregateSpec) -> Dict[Key, Dict]:
+    """Every aggregate of `table`, computed from the table itself."""
+    computed = {}
+    for group_column in (WHOLE_TABLE,) + spec.group_by:
+        cols = [func.count()]
+        for column in spec.columns:
+            c = table.c[column]
+            cols += [func.count(c), func.sum(c), func.min(c), func.max(c)]
+        if group_column:
+            stmt = (select(table.c[group_column], *cols).where(table.c[group_column].isnot(None))
+                    .group_by(table.c[group_column]))
+        else:
+            stmt = select(*cols)
+        for row in await db.execute(stmt):
+            group_value = str(row[0]) if group_column else WHOLE_TABLE
+            values = list(row[1:] if group_column else row)
+            computed[(group_column, group_value, ROWS)] = {"count": values[0], "total": 0,
+                                                          "min_value": None, "max_value": None}
+            for i, column in enumerate(spec.columns):
+                count, total, low, high = values[1 + 4 * i: 5 + 4 * i]
+                computed[(group_column, group_value, column)] = {
+                    "count": count, "total": int(total or 0), "min_value": low, "max_value": high}
+    return computed
+
+
+async def rebuild(db: AsyncSession, table: Table) -> int:
+    """Replace `table`'s aggregates with ones computed from a scan. Does not commit."""
+    spec = SPECS[table.name]
+    computed = await _compute(db, table, spec)
+    await db.execute(delete(AGGREGATES).where(AGGREGATES.c.table_name == table.name))
+    await db.execute(AGGREGATES.insert(), [
+        {"table_name": table.name, "group_column": key[0], "group_value": key[1], "column": key[2],
+         "stale": False, **values}
+        for key, values in computed.items()
+    ])
+    inc("aggregate_rebuilds_total", table=table.name)
+    return len(computed)
+
+
+async def ensure_built(db: AsyncSession, table: Table) -> bool:
+    """Build `table`'s aggregates if they have never been; True if this call built them."""
+    if table.name in _built:
+        return False
+    marker = await db.scalar(select(AGGREGATES.c.id).where(*_match(table.name, (WHOLE_TABLE, WHOLE_TABLE, ROWS))))
+    if marker is not None:
+        # Only cached once seen committed: a build in a transaction that rolls back must be redone
+        _built.add(table.name)
+        return False
+    await rebuild(db, table)
+    return True
+
+
+async def check(db: AsyncSession, table: Table) -> Dict:
+    """Compare the stored aggregates with a fresh scan; stale min/max are not compared."""
+    spec = SPECS[table.name]
+    computed = await _compute(db, table, spec)
+    stored = {
+        (r.group_column, r.group_value, r.column): r
+        for r in (await db.execute(select(AGGREGATES).where(AGGREGATES.c.table_name == table.name))).mappings()
+    }
+    mismatches = []
+    for key in sorted(set(computed) | set(stored)):
+        want, have = computed.get(key), stored.get(key)
+        if want is None:
+            # A group that has emptied out keeps its row
+            if have["count"] != 0:
+                mismatches.append({"key": key, "stored": dict(have), "computed": None})
+            continue
+        if have is None:
+            mismatches.append({"key": key, "stored": None, "computed": want})
+            continue
+        fields = ["count", "total"] if have["stale"] else ["count", "total", "min_value", "max_value"]
+        if any(have[f] != want[f] for f in fields):
+            mismatches.append({"key": key, "stored": {f: have[f] for f in fields},
+                               "computed": {f: want[f] for f in fields}})
+    return {"table": table.name, "aggregates": len(computed), "mismatches": mismatches}
+
+
+# ==========================================================
+# LOOKUP
+# ==========================================================
+
+def _match(table_name: str, key: Key):
+    agg = AGGREGATES.c
+    return (agg.table_name == table_name, agg.group_column == key[0],
+            agg.group_value == key[1], agg.column == key[2])
+
+
+def _key(spec: AggregateSpec, q) -> Optional[Key]:
+    """The aggregate that answers FilterQuery `q`, or None if it needs a scan."""
+    if q.kind not in KINDS:
+        return None
+    column = ROWS if q.kind == "count" else q.column
+    if column != ROWS and column not in spec.columns:
+        return None
+    if not q.where:
+        return WHOLE_TABLE, WHOLE_TABLE, column
+    if len(q.where) == 1 and len(q.where[0]) == 1:
+        c = q.where[0][0]
+        if c.op == "eq" and c.column in spec.group_by and c.value is not None:
+            return c.column, str(c.value), column
+    return None
+
+
+async def _refresh_extremes(db: AsyncSession, table: Table, key: Key):
+    group_column, group_value, column = key
+    where = true()
+    if group_column:
+        col = table.c[group_column]
+        where = col == col.type.python_type(group_value)
+    source = lambda agg: select(agg(table.c[column])).where(where).scalar_subquery()  # noqa: E731
+    await db.execute(
+        update(AGGREGATES).where(*_match(table.name, key))
+        .values(min_value=source(func.min), max_value=source(func.max), stale=False)
+    )
+
+
+async def lookup(db: AsyncSession, table: Table, q) -> Optional[Dict]:
+    """Answer a count/avg/min/max FilterQuery from the aggregates, or None if they can't."""
+    spec = _spec(table)
+    key = _key(spec, q) if spec is not None else None
+    if key is None:
+        return None
+
+    wrote = await ensure_built(db, table)
+    row = (await db.execute(select(AGGREGATES).where(*_match(table.name, key)))).mappings().first()
+    if row is not None and row["stale"] and q.kind in ("min", "max"):
+        await _refresh_extremes(db, table, key)
+        row = (await db.execute(select(AGGREGATES).where(*_match(table.name, key)))).mappings().first()
+        wrote = True
+    if wrote:
+        await db.commit()
+    inc("aggregate_lookups_total", table=table.name, kind=q.kind)
+
+    # No row: nothing in that group
+    count = row["count"] if row is not None else 0
+    if q.kind == "count":
+        return {"count": count}
+    if q.kind == "avg":
+        return {"avg": row["total"] / count if count else None}
+    return {q.kind: row[f"{q.kind}_value"] if count else None}
+
+
+# ==========================================================
+# CLI
+# ==========================================================
+
+async def _cli(args):
+    from database import AsyncSessionLocal, Base, migrate
+
+    migrate()
+    tables = [args.table] if args.table else sorted(SPECS)
+    reports = []
+    async with AsyncSessionLocal() as db:
+        for name in tables:
+            if name not in SPECS or name not in Base.metadata.tables:
+                raise SystemExit(f"No aggregates configured for table '{name}'")
+            table = Base.metadata.tables[name]
+            if args.command == "rebuild":
+                reports.append({"table": name, "aggregates": await rebuild(db, table)})
+                await db.commit()
+            else:
+                reports.append(await check(db, table))
+    print(json.dumps(reports, indent=2, default=str))
+    if args.command == "check" and any(r["mismatches"] for r in reports):
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("check", "rebuild"))
+    parser.add_argument("--table", help="only this table (default: every table with aggregates)")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
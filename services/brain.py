@@ -1,16 +1,82 @@
-from services.memory import get_or_create_session
+import asyncio
+import time
+from config import STREAM_SYNC_WAIT
+from services import idempotency, outbox, progress
+from services.recorder import record_turn
+from services.memory import session_turn
 from services.action import detect_action
-from services.flow import handle_flow
-from services.filter_builder import build_filter
-from flow_definitions import FLOW_STEPS
+from services.flow import FLOWS, handle_flow
 from context_definitions import list_available_contexts
+from database import AsyncSessionLocal
 
-def process_message(db, session_id, message, context=None):
-    session = get_or_create_session(db, session_id)
+# Streamed turns still running; held here so a turn whose client went away isn't garbage collected
+_turns = set()
 
+async def process_message(db, session_id, message, context=None, idempotency_key=None):
+    started = time.time()
+    # A retried message with the same key gets the stored reply
+    reply = await idempotency.run_once(
+        db, session_id, idempotency_key, lambda: _turn(db, session_id, message, context)
+    )
+    record_turn(started, session_id, message, context, idempotency_key, reply)
+    return reply
+
+
+async def _turn(db, session_id, message, context):
+    # The session is locked for the whole turn, and its changes are written back once at the end
+    async with session_turn(db, session_id) as session:
+        return await _process(db, session, message, context)
+
+
+async def stream_message(db, session_id, message, context=None, idempotency_key=None,
+                         sync_wait=STREAM_SYNC_WAIT):
+    """
+    Run one turn and yield its events as they happen: an immediate "ack",
+    pipeline progress ("validated", "saved"), the "result", and finally
+    "synced" / "sync_pending" for every HubSpot sync the turn queued.
+
+    The turn runs as its own task on its own database session, so a client
+    that disconnects mid-turn (which closes `db`) can't cut it short: it
+    still commits or rolls back as a whole, and its reply is stored only
+    if it really happened. `db` is only used to wait for the syncs.
+    """
+    yield {"event": "ack"}
+
+    queue = asyncio.Queue()
+    done = object()
+    pending_syncs = []
+
+    def on_progress(stage, info):
+        if "outbox_id" in info:
+            pending_syncs.append(info.pop("outbox_id"))
+        queue.put_nowait({"event": stage, **info})
+
+    async def run():
+        async with AsyncSessionLocal() as turn_db:
+            with progress.listen(on_progress):
+                return await process_message(turn_db, session_id, message, context, idempotency_key)
+
+    task = asyncio.create_task(run())
+    _turns.add(task)
+    task.add_done_callback(_turns.discard)
+    task.add_done_callback(lambda _: queue.put_nowait(done))
+    while (item := await queue.get()) is not done:
+        yield item
+
+    yield {"event": "result", "reply": task.result()}
+
+    for outbox_id in pending_syncs:
+        outcome = await outbox.wait_for(db, outbox_id, sync_wait)
+        if outcome is None:
+            yield {"event": "sync_pending"}
+        else:
+            yield {"event": "synced", **outcome}
+
+
+async def _process(db, session, message, context):
     # Continue existing flows FIRST
     if session.action and session.step:
-        return handle_flow(db, session, message)
+        return await handle_flow(db, session, message)
 
     decision = detect_action(message)
 
@@ -21,13 +87,15 @@ def process_message(db, session_id, message, context=None):
                 "message": "Please specify data context",
                 "available_contexts": list_available_contexts()
             }
+        from services.filter_builder import build_filter
         return build_filter(context, message)
 
     # EXISTING FLOWS (UNCHANGED)
-    if decision in FLOW_STEPS:
+    if decision in FLOWS:
+        first = FLOWS[decision].first
         session.action = decision
-        session.step = FLOW_STEPS[decision][0][0]
-        db.commit()
-        return FLOW_STEPS[decision][0][1]
+        session.step = first.step
+        session.dirty = True
+        return first.prompt
 
     return "I can help start a contract, update phone, or create data filters."
@@ -0,0 +1,288 @@
+"""
+Streaming bulk import and export of contracts.
+
+Import reads CSV (with a header row) or NDJSON one record at a time and
+works in batches of BULK_BATCH_SIZE. Each batch is validated column by
+column with validators.validate_many, normalized, and inserted with one executemany. A
+CREATE_DEAL outbox event is queued for every inserted contract, so the
+outbox worker pushes them to HubSpot through the batch API. Rejected rows
+are reported as they are found and never kept around, so memory stays
+flat however large the file is. A reject carries its line number, the
+errors and the source text (`raw`), so a rejects file can be fixed up
+and imported again.
+
+    python -m services.bulk import contracts.csv [--rejects rejects.ndjson] [--no-sync]
+    python -m services.bulk export [--format csv|ndjson] [--output contracts.csv]
+
+The same pipeline backs POST /api/contracts/bulk and GET /api/contracts/export.
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import BULK_BATCH_SIZE
+from models import Contract, OutboxEvent
+from services import aggregates, outbox
+from services.metrics import inc
+from validators import normalize_many, validate_many
+
+FIELDS = ("email", "name", "phone", "address")
+EXPORT_COLUMNS = ("id", "session_id", "session_shard", "email", "name", "phone", "address", "status")
+EXPORT_CHUNK_SIZE = 1000
+
+CONTRACTS = Contract.__table__
+OUTBOX = OutboxEvent.__table__
+
+# (first line number, fields or None if the line is not a record, source text)
+Record = Tuple[int, Optional[Dict], str]
+
+
+# ==========================================================
+# READING
+# ==========================================================
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without buffering all of it."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_file_lines(path: str) -> AsyncIterator[str]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Record]:
+    """Yield a Record per CSV row or NDJSON line."""
+    if fmt == "ndjson":
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_no, record if isinstance(record, dict) else None, line
+        return
+
+    header = None
+    record, start, line_no = "", 0, 0
+    async for line in lines:
+        line_no += 1
+        line = line.rstrip("\r")
+        if not record:
+            start = line_no
+        record = f"{record}\n{line}" if record else line
+        # A quoted field may span lines; an odd quote count means it is still open
+        if record.count('"') % 2:
+            continue
+        raw, record = record, ""
+        values = next(csv.reader([raw]), [])
+        if not values:
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        yield start, dict(zip(header, values)), raw
+
+
+async def batched(records: AsyncIterator, size: int) -> AsyncIterator[List]:
+    batch = []
+    async for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==========================================================
+# VALIDATION
+# ==========================================================
+
+def validate_batch(batch: List[Record]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Column-wise pass over a batch: each field is validated and then
+    normalized as a whole column. Returns (clean rows, rejects).
+    """
+    errors: Dict[int, Dict[str, str]] = {}
+    for i, (_, record, _) in enumerate(batch):
+        if record is None:
+            errors[i] = {"record": "not a JSON object"}
+    columns = {field: [str((record or {}).get(field) or "").strip() for _, record, _ in batch]
+               for field in FIELDS}
+
+    for field in FIELDS:
+        values = columns[field]
+        for i, (ok, message) in enumerate(validate_many(field.upper(), values)):
+            if not ok and batch[i][1] is not None:
+                errors.setdefault(i, {})[field] = message if values[i] else "missing"
+        columns[field] = normalize_many(field.upper(), values)
+
+    rows, rejects = [], []
+    for i, (line_no, record, raw) in enumerate(batch):
+        if i in errors:
+            rejects.append({"line": line_no, "errors": errors[i], "record": record or {}, "raw": raw})
+        else:
+            rows.append({field: columns[field][i] for field in FIELDS})
+    return rows, rejects
+
+
+# ==========================================================
+# IMPORT
+# ==========================================================
+
+async def import_contracts(db: AsyncSession, records: AsyncIterator[Record],
+                           batch_size: int = BULK_BATCH_SIZE, sync: bool = True) -> AsyncIterator[Dict]:
+    """
+    Validate and insert one batch per transaction. Yields a report per
+    batch: {"inserted", "rejected": [...]}. With sync=False no HubSpot
+    deals are queued and contracts are stored as IMPORTED.
+    """
+    status = "PENDING" if sync else "IMPORTED"
+    async for batch in batched(records, batch_size):
+        rows, rejects = validate_batch(batch)
+        now = datetime.utcnow()
+        if rows:
+            # Core inserts keep this an executemany (multi-row VALUES); RETURNING
+            # carries each row's own fields, so the outbox payloads and the
+            # aggregates do not rely on the order ids come back in
+            inserted = (await db.execute(
+                insert(CONTRACTS).returning(*CONTRACTS.c), [dict(row, status=status) for row in rows]
+            )).mappings().all()
+            if sync:
+                await db.execute(insert(OUTBOX), [
+                    {"contract_id": r["id"], "operation": outbox.CREATE_DEAL, "payload": {f: r[f] for f in FIELDS},
+                     "status": "PENDING", "attempts": 0, "available_at": now}
+                    for r in inserted
+                ])
+            await aggregates.track_inserts(db, CONTRACTS, inserted)
+            await db.commit()
+            if sync:
+                outbox.notify()
+
+        inc("bulk_rows_total", len(rows), result="inserted")
+        inc("bulk_rows_total", len(rejects), result="rejected")
+        yield {"inserted": len(rows), "rejected": rejects}
+
+
+async def run_import(db: AsyncSession, records: AsyncIterator[Record], rejects_out=None,
+                     batch_size: int = BULK_BATCH_SIZE, sync: bool = True) -> Dict:
+    """Drive import_contracts, writing rejects as NDJSON; returns the totals."""
+    totals = {"inserted": 0, "rejected": 0, "batches": 0}
+    async for report in import_contracts(db, records, batch_size, sync):
+        totals["inserted"] += report["inserted"]
+        totals["rejected"] += len(report["rejected"])
+        totals["batches"] += 1
+        if rejects_out is not None:
+            for reject in report["rejected"]:
+                rejects_out.write(json.dumps(reject) + "\n")
+    return totals
+
+
+# ==========================================================
+# EXPORT
+# ==========================================================
+
+async def export_contracts(db: AsyncSession, fmt: str = "csv") -> AsyncIterator[str]:
+    """Stream the contracts table as CSV (with header) or NDJSON text chunks."""
+    stmt = select(*(getattr(Contract, c) for c in EXPORT_COLUMNS)).order_by(Contract.id)
+    result = await db.stream(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+
+    if fmt == "ndjson":
+        async for rows in result.mappings().partitions():
+            yield "".join(json.dumps(dict(row)) + "\n" for row in rows)
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    yield _drain(buf)
+    async for rows in result.partitions():
+        writer.writerows(rows)
+        yield _drain(buf)
+
+
+def _drain(buf: io.StringIO) -> str:
+    text = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return text
+
+
+def guess_format(name: str) -> str:
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+# ==========================================================
+# CLI
+# ==========================================================
+
+async def _cli_import(args):
+    from database import AsyncSessionLocal, migrate
+
+    migrate()
+    fmt = args.format or guess_format(args.path)
+    rejects_out = open(args.rejects, "w") if args.rejects else None
+    try:
+        async with AsyncSessionLocal() as db:
+            totals = await run_import(db, iter_records(iter_file_lines(args.path), fmt),
+                                      rejects_out, args.batch_size, not args.no_sync)
+    finally:
+        if rejects_out:
+            rejects_out.close()
+    print(json.dumps(totals))
+
+
+async def _cli_export(args):
+    from database import AsyncSessionLocal
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        async with AsyncSessionLocal() as db:
+            async for text in export_contracts(db, args.format):
+                out.write(text)
+    finally:
+        if args.output:
+            out.close()
+
+
+def main(argv: Iterable[str] = None):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="load contracts from a CSV or NDJSON file")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=("csv", "ndjson"), help="default: from the file extension")
+    imp.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    imp.add_argument("--rejects", help="write rejected rows here as NDJSON")
+    imp.add_argument("--no-sync", action="store_true", help="do not queue HubSpot deals")
+
+    exp = sub.add_parser("export", help="write the contracts table to stdout or a file")
+    exp.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    exp.add_argument("--output")
+
+    args = parser.parse_args(argv)
+    asyncio.run(_cli_import(args) if args.command == "import" else _cli_export(args))
+
+
+if __name__ == "__main__":
+    main()
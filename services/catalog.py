@@ -0,0 +1,224 @@
+"""
+Column catalog for the filter contexts.
+
+context_definitions.AVAILABLE_CONTEXTS names the table behind each
+context and the synonyms people type for its columns. Columns and their
+types are reflected from that table in the catalog database
+(CATALOG_DATABASE_URL, default DATABASE_URL). A table that is not there
+is read from our own models, and failing that from the `columns` written
+in the definition. Columns listed under a definition's `exclude` (internal
+keys and links) are left out, so they can't be filtered on or updated.
+
+Each column is compiled into a word-level trie along with its spelled-out
+form ("first_name" -> "first name") and its synonyms. `match` returns the
+longest phrase starting at a word, so matching a query costs
+O(words x longest phrase) however many columns the table has, and a
+column only ever matches whole words ("name" never matches inside
+"username"). Real column names win over synonyms that spell the same.
+
+Reflecting hundreds of columns takes a few queries per table, so the
+compiled catalog is saved to CATALOG_CACHE_PATH under a fingerprint of
+the schema (one query) and the definitions, and rebuilt when either
+changes. The catalog is loaded once per process, so schema changes are
+picked up on restart. With CATALOG_TRUST_CACHE the cache written by
+`python -m migrate` is used as long as the definitions match, without
+connecting to the catalog database at all.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, bindparam, create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from config import CATALOG_CACHE_PATH, CATALOG_DATABASE_URL, CATALOG_TRUST_CACHE
+from context_definitions import AVAILABLE_CONTEXTS
+
+CATALOG_VERSION = 2
+END = "\0"                 # trie key holding the column a phrase resolves to
+PUNCTUATION = ".,;:?!"
+
+
+@dataclass
+class ContextCatalog:
+    key: str
+    table_name: str
+    columns: Dict[str, Dict]     # name -> {"type": one of COLUMN_TYPES}
+    trie: Dict
+
+    def match(self, words: Sequence[Optional[str]], start: int) -> Optional[Tuple[str, int]]:
+        """
+        Longest column phrase at words[start] as (column, words used).
+        Words are lowercased with PUNCTUATION stripped; None never matches.
+        """
+        node, found = self.trie, None
+        for i in range(start, len(words)):
+            node = node.get(words[i])
+            if node is None:
+                break
+            if END in node:
+                found = (node[END], i - start + 1)
+        return found
+
+
+def build_trie(columns: Dict[str, Dict], synonyms: Dict[str, List[str]]) -> Dict:
+    phrases = [(name, col) for col, names in synonyms.items() if col in columns for name in names]
+    # Inserted last, so a real column name overrides a synonym spelled the same
+    for col in columns:
+        phrases += [(col.replace("_", " "), col), (col, col)]
+
+    trie: Dict = {}
+    for phrase, col in phrases:
+        node = trie
+        for word in phrase.lower().split():
+            node = node.setdefault(word, {})
+        node[END] = col
+    return trie
+
+
+# Checked in order: DateTime before Date, and anything unlisted is a STRING
+COLUMN_TYPES = (
+    (Boolean, "BOOLEAN"),
+    (Integer, "INTEGER"),
+    (Numeric, "NUMERIC"),
+    (DateTime, "DATETIME"),
+    (Date, "DATE"),
+)
+
+
+def _type_name(sa_type) -> str:
+    for sa_class, name in COLUMN_TYPES:
+        if isinstance(sa_type, sa_class):
+            return name
+    return "STRING"
+
+
+# ==========================================================
+# REFLECTION
+# ==========================================================
+
+def _schema_rows(conn, tables: List[str]) -> List[List]:
+    """One cheap query whose result changes whenever the tables' columns do."""
+    if conn.dialect.name == "sqlite":
+        stmt = text("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN :tables ORDER BY name")
+    else:
+        stmt = text(
+            "SELECT table_name, column_name, data_type FROM information_schema.columns "
+            "WHERE table_name IN :tables ORDER BY table_name, ordinal_position"
+        )
+    stmt = stmt.bindparams(bindparam("tables", expanding=True))
+    return [list(row) for row in conn.execute(stmt, {"tables": tables})]
+
+
+def _definitions(metadata, tables: List[str]) -> str:
+    """Hash of what a catalog is built from, apart from the live schema."""
+    declared = {
+        name: [[c.name, str(c.type)] for c in metadata.tables[name].columns]
+        for name in tables if name in metadata.tables
+    }
+    payload = json.dumps([CATALOG_VERSION, AVAILABLE_CONTEXTS, declared], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _fingerprint(schema_rows: List[List], definitions: str) -> str:
+    payload = json.dumps([definitions, schema_rows], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _build(inspector, metadata) -> Dict[str, ContextCatalog]:
+    existing = set(inspector.get_table_names()) if inspector is not None else set()
+    catalog = {}
+    for key, definition in AVAILABLE_CONTEXTS.items():
+        table = definition["table_name"]
+        if table in existing:
+            columns = {c["name"]: {"type": _type_name(c["type"])} for c in inspector.get_columns(table)}
+        elif table in metadata.tables:
+            columns = {c.name: {"type": _type_name(c.type)} for c in metadata.tables[table].columns}
+        else:
+            columns = dict(definition.get("columns", {}))
+        for name in definition.get("exclude", ()):
+            columns.pop(name, None)
+        catalog[key] = ContextCatalog(key, table, columns, build_trie(columns, definition.get("synonyms", {})))
+    return catalog
+
+
+def load_catalog(trust_cache: bool = CATALOG_TRUST_CACHE) -> Dict[str, ContextCatalog]:
+    # Imported here so importing the filter builder doesn't open the database
+    from database import Base, engine, normalize_url
+    import models  # noqa: F401  (registers tables on Base)
+
+    tables = sorted({d["table_name"] for d in AVAILABLE_CONTEXTS.values()})
+    definitions = _definitions(Base.metadata, tables)
+    if trust_cache:
+        catalog = _read_cache("definitions", definitions)
+        if catalog is not None:
+            return catalog
+
+    bind = create_engine(normalize_url(CATALOG_DATABASE_URL)) if CATALOG_DATABASE_URL else engine
+    try:
+        with bind.connect() as conn:
+            fingerprint = _fingerprint(_schema_rows(conn, tables), definitions)
+            catalog = _read_cache("fingerprint", fingerprint)
+            if catalog is None:
+                catalog = _build(inspect(conn), Base.metadata)
+                _write_cache(fingerprint, definitions, catalog)
+            return catalog
+    except SQLAlchemyError:
+        # Catalog database unreachable: models and definitions only, not cached
+        return _build(None, Base.metadata)
+    finally:
+        if bind is not engine:
+            bind.dispose()
+
+
+# ==========================================================
+# DISK CACHE
+# ==========================================================
+
+def _read_cache(field: str, expected: str) -> Optional[Dict[str, ContextCatalog]]:
+    if not CATALOG_CACHE_PATH:
+        return None
+    try:
+        with open(CATALOG_CACHE_PATH) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get(field) != expected:
+        return None
+    return {key: ContextCatalog(key, **entry) for key, entry in data["contexts"].items()}
+
+
+def _write_cache(fingerprint: str, definitions: str, catalog: Dict[str, ContextCatalog]):
+    if not CATALOG_CACHE_PATH:
+        return
+    data = {
+        "fingerprint": fingerprint,
+        "definitions": definitions,
+        "contexts": {key: {"table_name": c.table_name, "columns": c.columns, "trie": c.trie}
+                     for key, c in catalog.items()},
+    }
+    tmp = f"{CATALOG_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, CATALOG_CACHE_PATH)
+    except OSError:
+        pass
+
+
+# ==========================================================
+# PUBLIC
+# ==========================================================
+
+_catalog: Optional[Dict[str, ContextCatalog]] = None
+_lock = threading.Lock()
+
+
+def get_catalog(context_key: str) -> Optional[ContextCatalog]:
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = load_catalog()
+    return _catalog.get(context_key.upper())
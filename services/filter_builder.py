@@ -1,246 +1,456 @@
 import re
-from typing import Dict, Optional
-from context_definitions import get_context_info
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from config import FILTER_BATCH_WORKERS
+from services.catalog import PUNCTUATION, ContextCatalog, get_catalog
+from services.metrics import lru_cache_gauges, observe
 
+PLAN_CACHE_SIZE = 1024
+BATCH_CHUNK_SIZE = 256
 
-class FilterBuilder:
-    """
-    Build Supabase SELECT and UPDATE queries from natural language
-    """
+Value = Union[bool, int, float, str, date, datetime]
 
-    def __init__(self, context_key: str):
-        self.context_key = context_key.upper()
-        self.context_info = get_context_info(self.context_key)
+BOOLEANS = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
 
-        if not self.context_info:
-            raise ValueError(f"Context '{context_key}' not found")
 
-        self.table_name = self.context_info["table_name"]
-        self.columns = self.context_info["columns"]
+# ==========================================================
+# LEXER
+# ==========================================================
 
-    # ==========================================================
-    # ENTRY POINT
-    # ==========================================================
+TOKEN_RE = re.compile(r"""
+    (?P<string>"[^"]*"|'[^']*')
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<op><=|>=|!=|=|<|>)
+  | (?P<comma>,)
+  | (?P<word>[^\s"'=<>!,]+)
+""", re.VERBOSE)
 
-    def parse_query(self, query: str) -> Dict:
-        query_lower = query.lower().strip()
 
-        # -------- UPDATE ----------
-        if any(w in query_lower for w in ["update", "set", "change", "modify"]):
-            return self._handle_update(query)
+class Token(NamedTuple):
+    kind: str    # string | number | op | comma | word
+    value: str   # lowercased for words, for matching keywords and columns
+    raw: str     # as typed, for bare values
 
-        base = f'supabase.table("{self.table_name}").select("*")'
 
-        # -------- AGGREGATIONS ----------
-        if any(w in query_lower for w in ["maximum", "max", "highest", "largest"]):
-            return self._handle_max(query_lower, base)
+def tokenize(query: str) -> List[Token]:
+    """
+    Split a query into tokens in one pass. Words are matched lowercased
+    but keep their original text too; quoted strings keep their case.
+    """
+    tokens = []
+    for m in TOKEN_RE.finditer(query):
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "string":
+            text = text[1:-1]
+        tokens.append(Token(kind, text.lower() if kind == "word" else text, text))
+    return tokens
 
-        if any(w in query_lower for w in ["minimum", "min", "lowest", "smallest"]):
-            return self._handle_min(query_lower, base)
 
-        if any(w in query_lower for w in ["average", "avg", "mean"]):
-            return self._handle_avg(query_lower)
+def resolve_columns(tokens: List[Token], catalog: ContextCatalog) -> List[Token]:
+    """
+    Replace every column phrase (longest match on whole words, synonyms
+    included) with a single word token holding the column name.
+    """
+    # Numbers take part too, for spelled-out names like "line 2 total"
+    words = [t.value.strip(PUNCTUATION) if t.kind in ("word", "number") else None for t in tokens]
+    root = catalog.trie
+    resolved, i = [], 0
+    while i < len(tokens):
+        found = catalog.match(words, i) if words[i] in root else None
+        if found:
+            resolved.append(Token("word", found[0], found[0]))
+            i += found[1]
+        else:
+            resolved.append(tokens[i])
+            i += 1
+    return resolved
 
-        # -------- COUNT ----------
-        if re.search(r"\b(count|total|how many|number of)\b", query_lower):
-            return self._handle_count()
 
-        # -------- FILTERS ----------
-        if "between" in query_lower:
-            return self._handle_between(query_lower, base)
+# ==========================================================
+# AST
+# ==========================================================
 
-        if any(w in query_lower for w in ["like", "contains", "includes"]):
-            return self._handle_like(query_lower, base)
+@dataclass
+class Condition:
+    column: str
+    op: str          # eq | neq | lt | lte | gt | gte | ilike
+    value: Value
 
-        # -------- CONDITIONS & COMPARISONS ----------
-        if any(w in query_lower for w in ["=", " is ", " equals ", "less than", "greater than",
-                                         "below", "above", "<", ">"]):
-            base = self._apply_conditions(query_lower, base)
-            return {"supabase_query": base}
 
-        # If no recognized pattern, return base
-        return {"supabase_query": base}
+@dataclass
+class FilterQuery:
+    kind: str = "select"                 # select | update | count | avg | max | min
+    column: Optional[str] = None         # target of max / min / avg
+    where: List[List[Condition]] = field(default_factory=list)  # OR of AND groups
+    updates: Dict[str, Value] = field(default_factory=dict)
+    order: Optional[Tuple[str, bool]] = None                    # (column, descending)
+    limit: Optional[int] = None
 
-    # ==========================================================
-    # UPDATE HANDLER
-    # ==========================================================
 
-    def _handle_update(self, query: str) -> Dict:
-        updates = self._extract_update_values(query)
-        conditions = self._extract_conditions(query)
+# ==========================================================
+# PARSER
+# ==========================================================
 
-        if not updates or not conditions:
-            return {"error": "Invalid UPDATE query. SET or WHERE clause missing"}
+UPDATE_WORDS = {"update", "change", "modify"}
 
-        update_payload = "{ " + ", ".join(
-            f'"{k}": "{v}"' if self.columns[k]["type"] == "STRING"
-            else f'"{k}": {v}'
-            for k, v in updates.items()
-        ) + " }"
+AGGREGATE_WORDS = {
+    "maximum": "max", "max": "max", "highest": "max", "largest": "max",
+    "minimum": "min", "min": "min", "lowest": "min", "smallest": "min",
+    "average": "avg", "avg": "avg", "mean": "avg",
+    "count": "count", "total": "count",
+}
 
-        base = f'supabase.table("{self.table_name}").update({update_payload})'
+SYMBOL_OPERATORS = {"=": "eq", "!=": "neq", "<": "lt", ">": "gt", "<=": "lte", ">=": "gte"}
 
-        for col, val in conditions.items():
-            if self.columns[col]["type"] == "STRING":
-                base += f'.eq("{col}", "{val}")'
-            else:
-                base += f'.eq("{col}", {val})'
+WORD_OPERATORS = {
+    "equals": "eq", "equal": "eq",
+    "below": "lt", "under": "lt",
+    "above": "gt", "over": "gt",
+    "like": "ilike", "contains": "ilike", "includes": "ilike",
+}
 
-        return {"supabase_query": base}
+# Words that never count as a bare (unquoted) value
+KEYWORDS = (
+    set(UPDATE_WORDS) | set(AGGREGATE_WORDS) | set(WORD_OPERATORS)
+    | {"set", "where", "and", "or", "is", "not", "between", "less", "greater",
+       "than", "at", "least", "most", "to", "order", "sort", "sorted", "by",
+       "limit", "top", "first", "asc", "desc", "ascending", "descending"}
+)
 
-    # ==========================================================
-    # SELECT HANDLERS
-    # ==========================================================
 
-    def _handle_max(self, query: str, base: str) -> Dict:
-        col = self._extract_column(query)
-        return {"supabase_query": f'{base}.order("{col}", desc=True).limit(1)'} if col else {"supabase_query": base}
+class _Parser:
+    """
+    Recursive-descent parser over the token list. Runs in a single
+    left-to-right pass; words it does not understand are skipped.
+    """
 
-    def _handle_min(self, query: str, base: str) -> Dict:
-        col = self._extract_column(query)
-        return {"supabase_query": f'{base}.order("{col}").limit(1)'} if col else {"supabase_query": base}
+    def __init__(self, tokens: List[Token], columns: Dict):
+        self.tokens = tokens
+        self.columns = columns
+        self.pos = 0
+
+    # ---------- token helpers ----------
+
+    def _peek(self, offset: int = 0) -> Optional[Token]:
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def _peek_word(self, offset: int = 0) -> Optional[str]:
+        tok = self._peek(offset)
+        return tok.value if tok and tok.kind == "word" else None
+
+    def _accept_word(self, *words: str) -> bool:
+        if self._peek_word() in words:
+            self.pos += 1
+            return True
+        return False
+
+    # ---------- grammar ----------
+
+    def parse(self) -> FilterQuery:
+        q = FilterQuery()
+        group: List[Condition] = []
+
+        while self.pos < len(self.tokens):
+            word = self._peek_word()
+
+            if word is None:
+                self.pos += 1
+            elif word in UPDATE_WORDS:
+                q.kind = "update"
+                self.pos += 1
+            elif word == "set":
+                q.kind = "update"
+                self.pos += 1
+                self._parse_assignments(q)
+            elif word == "or":
+                if group:
+                    q.where.append(group)
+                    group = []
+                self.pos += 1
+            elif (word, self._peek_word(1)) in (("how", "many"), ("number", "of")):
+                self._set_kind(q, "count")
+                self.pos += 2
+            elif word in AGGREGATE_WORDS:
+                self._set_kind(q, AGGREGATE_WORDS[word])
+                self.pos += 1
+            elif word in ("order", "sort", "sorted") and self._peek_word(1) == "by":
+                self.pos += 2
+                self._parse_order(q)
+            elif word in ("limit", "top", "first") and self._peek(1) and self._peek(1).kind == "number":
+                q.limit = int(float(self._peek(1).value))
+                self.pos += 2
+            elif word in self.columns:
+                self.pos += 1
+                conditions = self._parse_condition(word)
+                if conditions:
+                    group.extend(conditions)
+                elif q.column is None:
+                    q.column = word
+            else:
+                self.pos += 1
+
+        if group:
+            q.where.append(group)
+        return q
+
+    def _set_kind(self, q: FilterQuery, kind: str):
+        # UPDATE wins over everything, otherwise the first aggregate wins
+        if q.kind == "select":
+            q.kind = kind
+
+    def _parse_assignments(self, q: FilterQuery):
+        while True:
+            col = self._peek_word()
+            if col is None or col == "where":
+                return
+            tok = self._peek(1)
+            if not tok or tok.value not in ("=", "to"):
+                return
+            self.pos += 2
+            raw = self._parse_value()
+            if raw is None:
+                return
+            if col in self.columns:
+                q.updates[col] = self._coerce(col, raw)
 
-    def _handle_avg(self, query: str) -> Dict:
-        col = self._extract_column(query)
-        return {
-            "supabase_query": f'supabase.table("{self.table_name}").select("avg({col})")'
-        } if col else {"supabase_query": ""}
+            tok = self._peek()
+            if tok and (tok.kind == "comma" or tok.value == "and"):
+                self.pos += 1
+                continue
+            return
+
+    def _parse_order(self, q: FilterQuery):
+        col = self._peek_word()
+        if col not in self.columns:
+            return
+        self.pos += 1
+        desc = False
+        if self._accept_word("desc", "descending"):
+            desc = True
+        else:
+            self._accept_word("asc", "ascending")
+        q.order = (col, desc)
+
+    def _parse_condition(self, col: str) -> List[Condition]:
+        start = self.pos
+        op = self._parse_operator()
+        if op is None:
+            self.pos = start
+            return []
+
+        if op == "between":
+            low = self._parse_value()
+            self._accept_word("and")
+            high = self._parse_value()
+            if low is None or high is None:
+                self.pos = start
+                return []
+            return [
+                Condition(col, "gte", self._coerce(col, low)),
+                Condition(col, "lte", self._coerce(col, high)),
+            ]
+
+        raw = self._parse_value()
+        if raw is None:
+            self.pos = start
+            return []
+        if op == "ilike":
+            return [Condition(col, op, raw)]
+        return [Condition(col, op, self._coerce(col, raw))]
+
+    def _parse_operator(self) -> Optional[str]:
+        tok = self._peek()
+        if tok is None:
+            return None
+
+        if tok.kind == "op":
+            self.pos += 1
+            return SYMBOL_OPERATORS[tok.value]
+
+        if tok.kind != "word":
+            return None
+
+        word = tok.value
+        if word == "is":
+            self.pos += 1
+            return self._parse_operator() or "eq"
+        if word == "not":
+            self.pos += 1
+            return "neq" if self._parse_operator() in (None, "eq") else None
+        if word in ("less", "greater") and self._peek_word(1) == "than":
+            self.pos += 2
+            op = "lt" if word == "less" else "gt"
+            if self._peek_word() == "or" and self._peek_word(1) == "equal":
+                self.pos += 2
+                self._accept_word("to")
+                op += "e"
+            return op
+        if word == "at" and self._peek_word(1) in ("least", "most"):
+            self.pos += 2
+            return "gte" if self._peek_word(-1) == "least" else "lte"
+        if word == "between":
+            self.pos += 1
+            return "between"
+        if word in WORD_OPERATORS:
+            self.pos += 1
+            if WORD_OPERATORS[word] == "eq":
+                self._accept_word("to")
+            return WORD_OPERATORS[word]
+        return None
 
-    def _handle_count(self) -> Dict:
-        return {
-            "supabase_query": f'supabase.table("{self.table_name}").select("*", count="exact")'
-        }
+    def _parse_value(self) -> Optional[str]:
+        tok = self._peek()
+        if tok is None:
+            return None
+        if tok.kind in ("string", "number"):
+            self.pos += 1
+            return tok.value
+        if tok.kind == "word" and tok.value not in KEYWORDS and tok.value not in self.columns:
+            self.pos += 1
+            return tok.raw
+        return None
 
-    def _handle_between(self, query: str, base: str) -> Dict:
-        col = self._extract_column(query)
-        nums = re.findall(r'\d+', query)
+    def _coerce(self, col: str, raw: str) -> Value:
+        kind = self.columns[col]["type"]
+        try:
+            if kind == "INTEGER":
+                return int(raw)
+            if kind == "NUMERIC":
+                return float(raw)
+            if kind == "BOOLEAN":
+                return BOOLEANS[raw.lower()]
+            if kind == "DATETIME":
+                return datetime.fromisoformat(raw)
+            if kind == "DATE":
+                return date.fromisoformat(raw)
+        except (KeyError, ValueError):
+            expected = {"INTEGER": "a number", "NUMERIC": "a number", "BOOLEAN": "true or false",
+                        "DATETIME": "a date and time (YYYY-MM-DD HH:MM)", "DATE": "a date (YYYY-MM-DD)"}[kind]
+            raise ValueError(f"Column '{col}' expects {expected}, got '{raw}'")
+        return raw
+
+
+def parse(query: str, columns: Dict, catalog: Optional[ContextCatalog] = None) -> FilterQuery:
+    tokens = tokenize(query)
+    if catalog is not None:
+        tokens = resolve_columns(tokens, catalog)
+    return _Parser(tokens, columns).parse()
 
-        if not col or len(nums) < 2:
-            return {"supabase_query": base}
 
-        return {
-            "supabase_query": f'{base}.gte("{col}", {nums[0]}).lte("{col}", {nums[1]})'
-        }
+class FilterBuilder:
+    """
+    Build Supabase SELECT and UPDATE queries from natural language
+    """
 
-    def _handle_like(self, query: str, base: str) -> Dict:
-        col = self._extract_column(query)
-        val = self._extract_quoted_value(query)
+    def __init__(self, context_key: str):
+        self.context_key = context_key.upper()
+        self.catalog = get_catalog(self.context_key)
 
-        if not col or not val:
-            return {"supabase_query": base}
+        if not self.catalog:
+            raise ValueError(f"Context '{context_key}' not found")
 
-        return {
-            "supabase_query": f'{base}.ilike("{col}", "%{val}%")'
-        }
+        self.table_name = self.catalog.table_name
+        self.columns = self.catalog.columns
 
     # ==========================================================
-    # CONDITIONS + COMPARISONS (AND MULTIPLE)
+    # ENTRY POINT
     # ==========================================================
 
-    def _apply_conditions(self, query: str, base: str) -> str:
-        conditions = {}
-        operators = {
-            "less than": "lt",
-            "below": "lt",
-            "under": "lt",
-            "<": "lt",
-            "greater than": "gt",
-            "above": "gt",
-            "over": "gt",
-            ">": "gt",
-        }
-
-        for col, meta in self.columns.items():
-            # ----- EQUALITY -----
-            quoted_pattern = rf'{col}\s*(=|is|equals?)\s*["\']([^"\']+)["\']'
-            plain_pattern = rf'{col}\s*(=|is|equals?)\s*([0-9]+)'
-
-            quoted_match = re.search(quoted_pattern, query, re.IGNORECASE)
-            plain_match = re.search(plain_pattern, query, re.IGNORECASE)
-
-            if quoted_match:
-                val = quoted_match.group(2)
-                conditions[col] = val
-            elif plain_match:
-                val = int(plain_match.group(2))
-                conditions[col] = val
-
-            # ----- COMPARISONS -----
-            for phrase, op in operators.items():
-                pattern = rf'{col}.*?{phrase}.*?(\d+)'
-                match = re.search(pattern, query, re.IGNORECASE)
-                if match:
-                    val = int(match.group(1))
-                    if meta["type"] == "INTEGER":
-                        base += f'.{op}("{col}", {val})'
-                    else:
-                        base += f'.{op}("{col}", "{val}")'
-
-        # Apply equality conditions
-        for col, val in conditions.items():
-            if self.columns[col]["type"] == "STRING":
-                base += f'.eq("{col}", "{val}")'
-            else:
-                base += f'.eq("{col}", {val})'
-
-        return base
+    def parse_query(self, query: str) -> Dict:
+        # Timed per query kind (select/count/avg/max/update...), known only once parsed
+        start = time.perf_counter()
+        kind = "invalid"
+        try:
+            q = self.parse(query)
+            kind = q.kind
+            return self.render(q)
+        finally:
+            observe("span_seconds", time.perf_counter() - start, span="parse_query",
+                    context=self.context_key, kind=kind)
+
+    def parse(self, query: str) -> FilterQuery:
+        return parse(query, self.columns, self.catalog)
 
     # ==========================================================
-    # HELPERS
+    # SUPABASE RENDERER
     # ==========================================================
 
-    def _extract_column(self, query: str) -> Optional[str]:
-        for col in self.columns:
-            if col.lower() in query:
-                return col
-        return None
-
-    def _extract_quoted_value(self, query: str) -> Optional[str]:
-        match = re.findall(r'["\']([^"\']+)["\']', query)
-        return match[0] if match else None
+    def render(self, q: FilterQuery) -> Dict:
+        table = f'supabase.table("{self.table_name}")'
+
+        if q.kind == "update":
+            if not q.updates or not q.where:
+                return {"error": "Invalid UPDATE query. SET or WHERE clause missing"}
+            update_payload = "{ " + ", ".join(
+                f'"{k}": {self._literal(k, v)}' for k, v in q.updates.items()
+            ) + " }"
+            base = f'{table}.update({update_payload})'
+        elif q.kind == "count":
+            base = f'{table}.select("*", count="exact")'
+        elif q.kind == "avg":
+            if not q.column:
+                return {"supabase_query": ""}
+            base = f'{table}.select("avg({q.column})")'
+        else:
+            base = f'{table}.select("*")'
+
+        base += self._render_where(q.where)
+
+        if q.kind in ("max", "min") and q.column:
+            desc = ", desc=True" if q.kind == "max" else ""
+            base += f'.order("{q.column}"{desc}).limit(1)'
+        else:
+            if q.order:
+                col, desc = q.order
+                base += f'.order("{col}", desc=True)' if desc else f'.order("{col}")'
+            if q.limit is not None:
+                base += f'.limit({q.limit})'
 
-    def _extract_update_values(self, query: str) -> Dict:
-        updates = {}
-        match = re.search(r'set (.+?)( where|$)', query, re.IGNORECASE)
-        if not match:
-            return updates
-
-        assignments = match.group(1).split(",")
-
-        for item in assignments:
-            if "=" not in item:
-                continue
-            col, val = item.split("=", 1)
-            col = col.strip()
-            val = val.strip().strip('"\'')
-            if col in self.columns:
-                updates[col] = (
-                    val if self.columns[col]["type"] == "STRING" else int(val)
-                )
-
-        return updates
-
-    def _extract_conditions(self, query: str) -> Dict:
-        conditions = {}
-        match = re.search(r'where (.+)', query, re.IGNORECASE)
-        if not match:
-            return conditions
-
-        where_clause = match.group(1)
-
-        for col in self.columns:
-            m = re.search(
-                rf'{col}\s*=\s*["\']?([^"\']+)',
-                where_clause,
-                re.IGNORECASE
-            )
-            if m:
-                val = m.group(1)
-                if self.columns[col]["type"] == "INTEGER":
-                    val = int(val)
-                conditions[col] = val
+        return {"supabase_query": base}
 
-        return conditions
+    def _render_where(self, where: List[List[Condition]]) -> str:
+        if len(where) == 1:
+            return "".join(self._render_condition(c) for c in where[0])
+        if not where:
+            return ""
+
+        parts = []
+        for group in where:
+            filters = ",".join(self._postgrest_filter(c) for c in group)
+            parts.append(filters if len(group) == 1 else f"and({filters})")
+        return '.or_("' + ",".join(parts) + '")'
+
+    def _render_condition(self, c: Condition) -> str:
+        if c.op == "ilike":
+            return f'.ilike("{c.column}", "%{c.value}%")'
+        return f'.{c.op}("{c.column}", {self._literal(c.column, c.value)})'
+
+    def _postgrest_filter(self, c: Condition) -> str:
+        value = f"*{c.value}*" if c.op == "ilike" else _text(c.value)
+        if any(ch in value for ch in ',()" '):
+            value = '\\"' + value.replace('"', '') + '\\"'
+        return f"{c.column}.{c.op}.{value}"
+
+    def _literal(self, col: str, value: Value) -> str:
+        if isinstance(value, bool):
+            return str(value)
+        if self.columns[col]["type"] in ("STRING", "DATETIME", "DATE"):
+            return f'"{_text(value)}"'
+        return str(value)
+
+
+def _text(value: Value) -> str:
+    """A value as PostgREST spells it."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
 
 
 # ==========================================================
@@ -248,7 +458,61 @@ class FilterBuilder:
 # ==========================================================
 
 def build_filter(context_key: str, query: str) -> Dict:
+    # Dashboards resend the same handful of queries, so results are cached
+    # per (context, query). Hand out a copy so callers can't poison the cache.
+    return dict(_build_filter_cached(context_key, query.strip()))
+
+
+@lru_cache(maxsize=None)
+def get_filter_builder(context_key: str) -> FilterBuilder:
+    # Builders hold no per-query state, so one per context is enough
+    return FilterBuilder(context_key)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _build_filter_cached(context_key: str, query: str) -> Dict:
     try:
-        return FilterBuilder(context_key).parse_query(query)
+        return get_filter_builder(context_key).parse_query(query)
     except Exception as e:
         return {"error": str(e)}
+
+
+def build_filter_batch(items: List[Tuple[str, str]]) -> Iterator[Dict]:
+    """
+    Yield build_filter results for (context, query) pairs in input order.
+    Large batches are split into chunks and spread over a process pool.
+    """
+    if FILTER_BATCH_WORKERS <= 1 or len(items) <= BATCH_CHUNK_SIZE:
+        for context_key, query in items:
+            yield build_filter(context_key, query)
+        return
+
+    chunks = [items[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(items), BATCH_CHUNK_SIZE)]
+    for results in _get_batch_pool().map(_build_filter_chunk, chunks):
+        yield from results
+
+
+lru_cache_gauges("filter_plan", _build_filter_cached)
+
+_batch_pool = None
+
+
+def _get_batch_pool():
+    global _batch_pool
+    if _batch_pool is None:
+        # multiprocessing is only imported once a batch is big enough to need it
+        from concurrent.futures import ProcessPoolExecutor
+        _batch_pool = ProcessPoolExecutor(max_workers=FILTER_BATCH_WORKERS)
+    return _batch_pool
+
+
+def shutdown_batch_pool():
+    """Stop the batch worker processes (app shutdown). Blocks until they exit."""
+    global _batch_pool
+    if _batch_pool is not None:
+        _batch_pool.shutdown(cancel_futures=True)
+        _batch_pool = None
+
+
+def _build_filter_chunk(items: List[Tuple[str, str]]) -> List[Dict]:
+    return [build_filter(context_key, query) for context_key, query in items]
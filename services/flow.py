@@ -1,94 +1,164 @@
-from sqlalchemy.orm import Session
+from typing import Callable, Dict, NamedTuple, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import SHARD_INDEX
 from flow_definitions import FLOW_STEPS
 from models import Contract
-from services.tools.hubspot import create_deal, update_phone
-from validators import VALIDATORS
+from services import aggregates, outbox
+from services.metrics import timed
+from services.progress import emit
+from validators import VALIDATORS, normalize
 
-def handle_flow(db: Session, chat_session, message: str):
-    steps = FLOW_STEPS[chat_session.action]
 
-    current_index = next(
-        (i for i, step in enumerate(steps) if step[0] == chat_session.step),
-        None
-    )
-    if chat_session.data is None:
-        chat_session.data = {}
-    current_step = chat_session.step
-    if current_step in VALIDATORS:
-        is_valid, error_message = VALIDATORS[current_step](message)
+# ==========================================================
+# STATE MACHINE
+# ==========================================================
+
+class FlowState(NamedTuple):
+    step: str
+    prompt: str
+    next_step: Optional[str]     # None on the last step
+
+    @property
+    def validator(self) -> Optional[Callable]:
+        # Looked up per message, so validators.register() can add or replace one at any time
+        return VALIDATORS.get(self.step)
+
+
+class Flow:
+    """
+    One entry of FLOW_STEPS compiled into a step -> state lookup table
+    """
+
+    def __init__(self, action: str, steps):
+        self.action = action
+        self.states: Dict[str, FlowState] = {}
+        for i, (step, prompt) in enumerate(steps):
+            next_step = steps[i + 1][0] if i + 1 < len(steps) else None
+            self.states[step] = FlowState(step, prompt, next_step)
+        self.first = self.states[steps[0][0]]
+
+
+FLOWS: Dict[str, Flow] = {action: Flow(action, steps) for action, steps in FLOW_STEPS.items()}
+
+FINALIZERS: Dict[str, Callable] = {}
+
+
+def finalizer(action: str):
+    """Register the coroutine that runs when `action`'s last step is answered."""
+    def register(fn):
+        FINALIZERS[action] = fn
+        return fn
+    return register
+
+
+class StayInFlow(Exception):
+    """Raised by a finalizer to reply without ending the flow."""
+
+
+@timed("handle_flow")
+async def handle_flow(db: AsyncSession, chat_session, message: str):
+    state = FLOWS[chat_session.action].states[chat_session.step]
+
+    if state.validator:
+        is_valid, error_message = state.validator(message)
         if not is_valid:
             return error_message
-    chat_session.data[chat_session.step.lower()] = message
-    db.commit()
+        emit("validated", step=state.step)
+        message = normalize(state.step, message)
+    chat_session.data[state.step.lower()] = message
+    chat_session.dirty = True
 
-    if current_index == len(steps) - 1:
-        return finalize_action(db, chat_session)
+    if state.next_step is None:
+        # Keep the last answer in the session's event log; finalizing clears data
+        chat_session.checkpoint()
+        return await finalize_action(db, chat_session)
 
-    next_step, prompt = steps[current_index + 1]
-    chat_session.step = next_step
-    db.commit()
-    return prompt
+    chat_session.step = state.next_step
+    return FLOWS[chat_session.action].states[state.next_step].prompt
 
 
-def finalize_action(db: Session, chat_session):
+@timed("finalize_action")
+async def finalize_action(db: AsyncSession, chat_session):
     data = chat_session.data if chat_session.data else {}
-    action = chat_session.action
+    handler = FINALIZERS.get(chat_session.action)
     response = "Something went wrong"
 
     try:
-        if action == "START_CONTRACT":
-            contract = Contract(
-                session=chat_session,
-                email=data.get("email", ""),
-                name=data.get("name", ""),
-                phone=data.get("phone", ""),
-                address=data.get("address", ""),
-                status="PENDING"
-            )
-            db.add(contract)
-            db.commit()
-            db.refresh(contract)
-
-            deal_response=create_deal(data)
-            contract.status = "COMPLETED"
-            db.commit()
-
-            response = {
-                "message":"Contract started successfully",
-                "deal_id":deal_response["deal_id"]
-            }
-
-        elif action == "UPDATE_PHONE":
-            contract_id_str = data.get("contract_id")
-            phone = data.get("phone")
-            
-            if not contract_id_str:
-                return "Contract ID is missing"
-            
-            contract_id = int(contract_id_str)
-
-            contract = db.query(Contract).filter_by(id=contract_id).first()
-            if not contract:
-                chat_session.step = "CONTRACT_ID"
-                db.commit()
-                return "Contract not found. Try again."
-
-            contract.phone = phone
-            db.commit()
-            update_phone(contract_id, phone)
-
-            response = "Phone updated successfully"
+        if handler:
+            response = await handler(db, chat_session, data)
 
         chat_session.action = None
         chat_session.step = None
         chat_session.data = {}
-        db.commit()
+        chat_session.dirty = True
+
+    except StayInFlow as e:
+        return str(e)
 
     except Exception as e:
+        await db.rollback()
         chat_session.action = None
         chat_session.step = None
         chat_session.data = {}
-        db.commit()
+        chat_session.dirty = True
         response = f"Error: {str(e)}"
 
-    return response
\ No newline at end of file
+    return response
+
+
+# ==========================================================
+# FINALIZERS
+# ==========================================================
+
+@finalizer("START_CONTRACT")
+async def start_contract(db: AsyncSession, chat_session, data):
+    contract = Contract(
+        session_id=chat_session.id,
+        session_shard=SHARD_INDEX,
+        email=data.get("email", ""),
+        name=data.get("name", ""),
+        phone=data.get("phone", ""),
+        address=data.get("address", ""),
+        status="PENDING"
+    )
+    db.add(contract)
+    await db.flush()
+    await aggregates.track_inserts(db, Contract.__table__, [contract])
+
+    # The HubSpot deal is created by the outbox worker, which
+    # flips the contract to COMPLETED once it exists
+    event = outbox.enqueue(db, contract.id, outbox.CREATE_DEAL, dict(data))
+    await db.commit()
+    outbox.notify()
+    emit("saved", contract_id=contract.id, outbox_id=event.id)
+
+    return {
+        "message": "Contract started successfully",
+        "contract_id": contract.id,
+        "deal_status": "PENDING"
+    }
+
+
+@finalizer("UPDATE_PHONE")
+async def update_contract_phone(db: AsyncSession, chat_session, data):
+    contract_id_str = data.get("contract_id")
+    phone = data.get("phone")
+
+    if not contract_id_str:
+        raise StayInFlow("Contract ID is missing")
+
+    contract_id = int(contract_id_str)
+
+    contract = await db.get(Contract, contract_id)
+    if not contract:
+        chat_session.step = "CONTRACT_ID"
+        chat_session.dirty = True
+        raise StayInFlow("Contract not found. Try again.")
+
+    await aggregates.update_where(db, Contract.__table__, Contract.id == contract_id, {"phone": phone})
+    event = outbox.enqueue(db, contract_id, outbox.UPDATE_PHONE, {"phone": phone})
+    await db.commit()
+    outbox.notify()
+    emit("saved", contract_id=contract_id, outbox_id=event.id)
+
+    return "Phone updated successfully"
@@ -0,0 +1,175 @@
+"""
+Run a chat turn at most once per (session_id, idempotency_key).
+
+The key is claimed by inserting a chat_replies row before the turn runs;
+the unique constraint makes a concurrent duplicate in another process
+fail the claim and wait for the stored reply instead. Duplicates within
+one process share the same in-flight future, and recent replies are
+kept in a bounded LRU in front of the table. Rows older than
+IDEMPOTENCY_TTL are pruned as new keys are claimed.
+
+A claim is a lease: when a turn dies without storing its reply or
+releasing the key (a crash, or a failure after the turn's own commit),
+the next retry after IDEMPOTENCY_CLAIM_TIMEOUT takes the claim over and
+runs the turn, and pruning drops such claims as well.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CLAIM_TIMEOUT, IDEMPOTENCY_TTL, IDEMPOTENCY_WAIT
+from models import ChatReply
+from services.metrics import inc
+from services.progress import emit
+
+Key = Tuple[str, str]
+
+STILL_RUNNING = "This message is still being processed, please try again shortly"
+PRUNE_EVERY = 1000
+POLL_INTERVAL = 0.1
+
+_replies: "OrderedDict[Key, Tuple[object, float]]" = OrderedDict()   # key -> (reply, stored at)
+_lock = threading.Lock()
+_inflight: Dict[Key, asyncio.Future] = {}
+_claims = 0
+
+
+async def run_once(db: AsyncSession, session_id: str, key: Optional[str], turn: Callable[[], Awaitable]):
+    """Return the stored reply for a repeated key, otherwise run `turn` and store its reply."""
+    if not key:
+        return await turn()
+    k = (session_id, key)
+
+    with _lock:
+        cached = _replies.get(k)
+        if cached is not None and time.monotonic() - cached[1] < IDEMPOTENCY_TTL:
+            _replies.move_to_end(k)
+            return _replayed(cached[0])
+
+    pending = _inflight.get(k)
+    if pending is not None:
+        return _replayed(await asyncio.shield(pending))
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[k] = future
+    try:
+        reply = await _run_claimed(db, k, turn)
+        future.set_result(reply)
+        return reply
+    except BaseException as e:
+        future.set_exception(e)
+        # Nobody else may be awaiting it; don't warn about an unretrieved exception
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(k, None)
+
+
+async def _run_claimed(db: AsyncSession, k: Key, turn: Callable[[], Awaitable]):
+    if not await _claim(db, k):
+        stored = await _wait_for_reply(db, k)
+        return _replayed(stored) if stored is not None else STILL_RUNNING
+
+    try:
+        reply = await turn()
+    except BaseException:
+        # Release the key so a retry can run the turn
+        await db.rollback()
+        await db.execute(_match(delete(ChatReply), k))
+        await db.commit()
+        raise
+
+    await db.execute(_match(update(ChatReply), k).values(reply=reply))
+    await db.commit()
+    _remember(k, reply)
+    return reply
+
+
+async def _claim(db: AsyncSession, k: Key) -> bool:
+    global _claims
+    now = datetime.utcnow()
+    existing = await db.scalar(_match(select(ChatReply), k))
+    if existing is not None:
+        if existing.created_at >= now - timedelta(seconds=IDEMPOTENCY_TTL):
+            if existing.reply is not None:
+                return False
+            # Claimed but unanswered: take it over once the claim is stale.
+            # Conditional, so only one of several racing retries wins.
+            result = await db.execute(
+                _match(update(ChatReply), k).where(_stale_claim(now)).values(claimed_at=now)
+            )
+            await db.commit()
+            if result.rowcount:
+                inc("idempotent_claims_taken_over_total")
+            return bool(result.rowcount)
+        # Expired key: treat the message as new
+        await db.execute(_match(delete(ChatReply), k))
+
+    db.add(ChatReply(session_id=k[0], idempotency_key=k[1], claimed_at=now))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+
+    _claims += 1
+    if _claims % PRUNE_EVERY == 0:
+        await prune_expired(db)
+    return True
+
+
+async def _wait_for_reply(db: AsyncSession, k: Key):
+    """Poll for the reply of a turn claimed elsewhere; None if it doesn't arrive in time."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT
+    while True:
+        row = await db.scalar(_match(select(ChatReply), k).execution_options(populate_existing=True))
+        if row is not None and row.reply is not None:
+            _remember(k, row.reply)
+            return row.reply
+        if loop.time() >= deadline:
+            return None
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def prune_expired(db: AsyncSession) -> int:
+    """Delete expired replies and stale claims."""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=IDEMPOTENCY_TTL)
+    result = await db.execute(
+        delete(ChatReply).where(or_(
+            and_(ChatReply.reply.isnot(None), ChatReply.created_at < cutoff),
+            _stale_claim(now),
+        ))
+    )
+    await db.commit()
+    return result.rowcount
+
+
+def _stale_claim(now: datetime):
+    # Rows claimed before claimed_at existed count from created_at
+    started = func.coalesce(ChatReply.claimed_at, ChatReply.created_at)
+    return and_(ChatReply.reply.is_(None), started < now - timedelta(seconds=IDEMPOTENCY_CLAIM_TIMEOUT))
+
+
+def _match(stmt, k: Key):
+    return stmt.where(ChatReply.session_id == k[0], ChatReply.idempotency_key == k[1])
+
+
+def _remember(k: Key, reply):
+    with _lock:
+        _replies[k] = (reply, time.monotonic())
+        _replies.move_to_end(k)
+        while len(_replies) > IDEMPOTENCY_CACHE_SIZE:
+            _replies.popitem(last=False)
+
+
+def _replayed(reply):
+    inc("idempotent_replays_total")
+    emit("replayed")
+    return reply
@@ -0,0 +1,160 @@
+"""
+Propose (and optionally create) indexes from the filter usage log.
+
+Reads FILTER_USAGE_LOG, counts which column/operator shapes are hot and
+proposes one composite index per shape: equality columns first, then
+the first range or ORDER BY column. Indexes that an existing or another
+proposed index already covers (as a leading prefix) are dropped. For
+the most frequent queries an EXPLAIN (QUERY PLAN) is shown before and
+after the proposed indexes exist.
+
+    python -m services.index_advisor --log filters.jsonl [--min-hits 50] [--apply]
+
+Without --apply the indexes are created inside a transaction that is
+rolled back. Postgres DDL is transactional as is; pysqlite never emits
+BEGIN before DDL, so on SQLite the driver is put in autocommit mode and
+the advisor issues BEGIN / ROLLBACK itself.
+"""
+import argparse
+import json
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from config import FILTER_USAGE_LOG
+from database import engine
+from services.filter_builder import get_filter_builder
+from services.query_executor import compile_filter
+
+EQUALITY_OPS = {"eq"}
+RANGE_OPS = {"lt", "lte", "gt", "gte"}
+
+
+class IndexProposal(NamedTuple):
+    table: str
+    columns: Tuple[str, ...]
+    hits: int
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"
+
+    def ddl(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+
+def load_usage(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def index_shape(group: List[List[str]], order: str = None) -> Tuple[str, ...]:
+    """Ideal index for one AND group: equality columns, then one range/order column."""
+    eq_cols = sorted({col for col, op in group if op in EQUALITY_OPS})
+    tail = next((col for col, op in group if op in RANGE_OPS and col not in eq_cols), None)
+    if tail is None and order and order not in eq_cols:
+        tail = order
+    return tuple(eq_cols) + ((tail,) if tail else ())
+
+
+def propose_indexes(entries: Iterable[Dict], existing: Dict[str, List[Tuple[str, ...]]],
+                    min_hits: int = 1) -> List[IndexProposal]:
+    shapes = Counter()
+    for entry in entries:
+        table = get_filter_builder(entry["context"]).table_name
+        # Each OR branch is looked up on its own
+        groups = entry["where"] or [[]]
+        for group in groups:
+            shape = index_shape(group, entry.get("order"))
+            if shape:
+                shapes[(table, shape)] += 1
+
+    candidates = sorted(
+        (IndexProposal(table, cols, hits) for (table, cols), hits in shapes.items() if hits >= min_hits),
+        key=lambda p: (-len(p.columns), -p.hits),
+    )
+
+    proposals: List[IndexProposal] = []
+    for cand in candidates:
+        covering = existing.get(cand.table, []) + [p.columns for p in proposals if p.table == cand.table]
+        if any(cols[:len(cand.columns)] == cand.columns for cols in covering):
+            continue
+        proposals.append(cand)
+    return sorted(proposals, key=lambda p: -p.hits)
+
+
+def existing_indexes(bind: Engine) -> Dict[str, List[Tuple[str, ...]]]:
+    inspector = inspect(bind)
+    result = {}
+    for table in inspector.get_table_names():
+        cols = [tuple(ix["column_names"]) for ix in inspector.get_indexes(table) if None not in ix["column_names"]]
+        pk = inspector.get_pk_constraint(table).get("constrained_columns") or []
+        if pk:
+            cols.append(tuple(pk))
+        result[table] = cols
+    return result
+
+
+def explain(conn: Connection, context: str, query: str) -> List[str]:
+    _, stmt = compile_filter(context, query)
+    sql = str(stmt.compile(conn, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [row[0] for row in conn.execute(text(f"EXPLAIN {sql}"))]
+
+
+@contextmanager
+def _transaction(conn: Connection, keep: bool):
+    """A transaction that also covers DDL, committed only if `keep`."""
+    if conn.dialect.name != "sqlite":
+        with conn.begin() as trans:
+            yield
+            if not keep:
+                trans.rollback()
+        return
+    # pysqlite would run CREATE INDEX outside any transaction; drive it by hand
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    conn.exec_driver_sql("BEGIN")
+    try:
+        yield
+    except BaseException:
+        conn.exec_driver_sql("ROLLBACK")
+        raise
+    conn.exec_driver_sql("COMMIT" if keep else "ROLLBACK")
+
+
+def run(entries: List[Dict], bind: Engine = engine, min_hits: int = 1, top: int = 5, apply: bool = False) -> Dict:
+    proposals = propose_indexes(entries, existing_indexes(bind), min_hits)
+    hot = Counter((e["context"], e["query"]) for e in entries if e["kind"] != "update").most_common(top)
+
+    with bind.connect() as conn, _transaction(conn, keep=apply):
+        before = {query: explain(conn, ctx, query) for (ctx, query), _ in hot}
+        for p in proposals:
+            conn.execute(text(p.ddl()))
+        after = {query: explain(conn, ctx, query) for (ctx, query), _ in hot}
+
+    return {
+        "applied": apply,
+        "proposals": [{"name": p.name, "table": p.table, "columns": list(p.columns),
+                       "hits": p.hits, "ddl": p.ddl()} for p in proposals],
+        "plans": [{"query": query, "hits": hits, "before": before[query], "after": after[query]}
+                  for (_, query), hits in hot],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", default=FILTER_USAGE_LOG, help="filter usage JSONL (default FILTER_USAGE_LOG)")
+    parser.add_argument("--min-hits", type=int, default=1, help="ignore shapes seen fewer times")
+    parser.add_argument("--top", type=int, default=5, help="queries to EXPLAIN before/after")
+    parser.add_argument("--apply", action="store_true", help="keep the indexes instead of rolling back")
+    args = parser.parse_args()
+    if not args.log:
+        parser.error("no usage log: pass --log or set FILTER_USAGE_LOG")
+
+    print(json.dumps(run(load_usage(args.log), min_hits=args.min_hits, top=args.top, apply=args.apply), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Expire abandoned chat sessions and keep the session tables compact.
+
+A session whose last_active_at is older than SESSION_IDLE_TTL is deleted
+along with its event log, JANITOR_BATCH_SIZE sessions at a time. Each
+batch is one short transaction, and the janitor sleeps
+JANITOR_BATCH_PAUSE between batches, so chat turns never wait long on the
+write lock. The delete re-checks the cutoff, so a session that came back
+in the meantime is kept. With JANITOR_ARCHIVE_PATH set, every deleted
+session (row, events, contract ids) is first appended there as NDJSON.
+Contracts outlive their session; their session_id is cleared. In sharded
+mode session ids are only unique within a shard, so a janitor clears
+(and archives) only contracts whose session_shard is its own shard;
+contracts without one are left linked.
+
+Rows from before activity tracking (last_active_at NULL) are stamped with
+the time of the first sweep, which gives them a full TTL of grace.
+
+Every JANITOR_COMPACT_INTERVAL (0 = never) the session tables are
+ANALYZEd. A SQLite file is also VACUUMed when at least
+JANITOR_VACUUM_FREE_RATIO of it is free pages; Postgres gets
+VACUUM (ANALYZE). A SQLite VACUUM holds the write lock until it is done.
+
+The janitor runs inside the app (JANITOR_ENABLED, started by main.py's
+lifespan; in sharded mode every worker sweeps its own shard) or by hand:
+
+    python -m services.janitor [--ttl SECONDS] [--compact | --vacuum] [--shard N]
+
+Counts are exported as chatbot_janitor_* metrics.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import (
+    JANITOR_ARCHIVE_PATH, JANITOR_BATCH_PAUSE, JANITOR_BATCH_SIZE, JANITOR_COMPACT_INTERVAL,
+    JANITOR_INTERVAL, JANITOR_VACUUM_FREE_RATIO, SESSION_IDLE_TTL, SHARD_COUNT, SHARD_INDEX,
+)
+from models import ChatSession, Contract, SessionEvent
+from services import aggregates
+from services.memory import session_store
+from services.metrics import gauges, inc, observe
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = ChatSession.__table__
+EVENTS = SessionEvent.__table__
+SQLITE_ANALYSIS_LIMIT = 1000   # rows sampled per index by ANALYZE
+
+_task: Optional[asyncio.Task] = None
+last_sweep: Dict = {}
+
+
+# ==========================================================
+# EXPIRY
+# ==========================================================
+
+async def sweep(db: AsyncSession, ttl: float = SESSION_IDLE_TTL, batch_size: int = JANITOR_BATCH_SIZE,
+                pause: float = JANITOR_BATCH_PAUSE, archive: str = JANITOR_ARCHIVE_PATH,
+                shard: Optional[int] = SHARD_INDEX) -> Dict:
+    """
+    Delete every session idle for longer than `ttl`, one batch per
+    transaction. `shard` is the shard being swept, in sharded mode.
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    totals = {"stamped": await _stamp_untracked(db, now, batch_size, pause),
+              "expired": 0, "events_deleted": 0, "batches": 0}
+
+    cutoff = now - timedelta(seconds=ttl)
+    archive_out = open(archive, "a") if archive else None
+    try:
+        while True:
+            expired, events = await _expire_batch(db, cutoff, batch_size, archive_out, shard)
+            if not expired:
+                break
+            session_store.discard(expired)
+            totals["expired"] += len(expired)
+            totals["events_deleted"] += events
+            totals["batches"] += 1
+            await asyncio.sleep(pause)
+    finally:
+        if archive_out:
+            archive_out.close()
+
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    inc("janitor_sweeps_total")
+    inc("janitor_sessions_stamped_total", totals["stamped"])
+    inc("janitor_sessions_expired_total", totals["expired"])
+    inc("janitor_events_deleted_total", totals["events_deleted"])
+    observe("janitor_sweep_seconds", totals["seconds"])
+    last_sweep.update(totals, at=time.time())
+    return totals
+
+
+async def _stamp_untracked(db: AsyncSession, now: datetime, batch_size: int, pause: float) -> int:
+    total = 0
+    while True:
+        batch = select(SESSIONS.c.id).where(SESSIONS.c.last_active_at.is_(None)).limit(batch_size)
+        result = await db.execute(
+            update(SESSIONS).where(SESSIONS.c.id.in_(batch.scalar_subquery())).values(last_active_at=now)
+        )
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+def _linked_contracts(ids: List[int], shard: Optional[int]):
+    """WHERE clause for the contracts of these session rows, or None when that is ambiguous."""
+    if SHARD_COUNT <= 1:
+        return Contract.session_id.in_(ids)
+    if shard is None:
+        return None
+    return and_(Contract.session_id.in_(ids), Contract.session_shard == shard)
+
+
+async def _expire_batch(db: AsyncSession, cutoff: datetime, batch_size: int, archive_out,
+                        shard: Optional[int]) -> Tuple[List[str], int]:
+    """Delete one batch; returns the session_ids removed and the number of events deleted with them."""
+    candidates = (await db.scalars(
+        select(SESSIONS.c.id).where(SESSIONS.c.last_active_at < cutoff)
+        .order_by(SESSIONS.c.last_active_at).limit(batch_size)
+    )).all()
+    if not candidates:
+        return [], 0
+
+    # Re-check the cutoff (a session may have had a turn since it was
+    # selected) with a no-op UPDATE: it takes the write lock on SQLite and
+    # the row locks on Postgres, so the batch can't come back to life
+    # between here and its delete
+    rows = (await db.execute(
+        update(SESSIONS).where(SESSIONS.c.id.in_(candidates), SESSIONS.c.last_active_at < cutoff)
+        .values(last_active_at=SESSIONS.c.last_active_at)
+        .returning(*SESSIONS.c)
+    )).mappings().all()
+    if not rows:
+        await db.commit()
+        return [], 0
+
+    # Children first: contracts and events reference chat_sessions
+    ids = [row["id"] for row in rows]
+    linked = _linked_contracts(ids, shard)
+    if archive_out is not None:
+        await _archive(db, rows, archive_out, linked)
+    if linked is not None:
+        await aggregates.update_where(db, Contract.__table__, linked, {"session_id": None})
+    events = (await db.execute(delete(EVENTS).where(EVENTS.c.session_id.in_(ids)))).rowcount
+    await db.execute(delete(SESSIONS).where(SESSIONS.c.id.in_(ids)))
+    await db.commit()
+    return [row["session_id"] for row in rows], events
+
+
+async def _archive(db: AsyncSession, rows, out, linked):
+    ids = [row["id"] for row in rows]
+    events: Dict[int, List[Dict]] = {}
+    result = await db.execute(
+        select(EVENTS.c.session_id, EVENTS.c.kind, EVENTS.c.action, EVENTS.c.step, EVENTS.c.field,
+               EVENTS.c.value, EVENTS.c.created_at)
+        .where(EVENTS.c.session_id.in_(ids)).order_by(EVENTS.c.id)
+    )
+    for event in result.mappings():
+        event = dict(event)
+        events.setdefault(event.pop("session_id"), []).append(event)
+    contracts: Dict[int, List[int]] = {}
+    if linked is not None:
+        for contract_id, session_pk in await db.execute(select(Contract.id, Contract.session_id).where(linked)):
+            contracts.setdefault(session_pk, []).append(contract_id)
+
+    for row in rows:
+        entry = dict(row, events=events.get(row["id"], []), contract_ids=contracts.get(row["id"], []))
+        out.write(json.dumps(entry, default=str) + "\n")
+    out.flush()
+
+
+# ==========================================================
+# COMPACTION
+# ==========================================================
+
+def compact(engine: Engine, vacuum: Optional[bool] = None) -> Dict:
+    """
+    ANALYZE the session tables and VACUUM when worthwhile (vacuum=None),
+    always (True) or never (False). Blocking; run it in a thread.
+    """
+    started = time.perf_counter()
+    tables = (SESSIONS.name, EVENTS.name)
+    report: Dict = {"vacuumed": False}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "sqlite":
+            pages = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+            report["free_ratio"] = round(free / pages, 3) if pages else 0.0
+            # Sampled statistics: a full ANALYZE scans every index
+            conn.exec_driver_sql(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}")
+            for table in tables:
+                conn.exec_driver_sql(f"ANALYZE {table}")
+            if vacuum or (vacuum is None and report["free_ratio"] >= JANITOR_VACUUM_FREE_RATIO):
+                conn.exec_driver_sql("VACUUM")
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+                report["vacuumed"] = True
+        else:
+            verb = "VACUUM (ANALYZE)" if vacuum is not False else "ANALYZE"
+            for table in tables:
+                conn.exec_driver_sql(f"{verb} {table}")
+            report["vacuumed"] = vacuum is not False
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    inc("janitor_compactions_total", vacuumed=str(report["vacuumed"]).lower())
+    return report
+
+
+def session_engine() -> Engine:
+    """The sync engine chat_sessions lives on (the shard's, in sharded mode)."""
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        return db.get_bind(ChatSession)
+
+
+# ==========================================================
+# WORKER
+# ==========================================================
+
+@gauges
+def _report():
+    if not last_sweep:
+        return []
+    return [
+        ("janitor_last_sweep_timestamp_seconds", {}, last_sweep["at"]),
+        ("janitor_last_sweep_expired", {}, last_sweep["expired"]),
+    ]
+
+
+async def run_janitor():
+    from database import AsyncSessionLocal
+
+    last_compact = time.monotonic()
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await sweep(db)
+                if JANITOR_COMPACT_INTERVAL and time.monotonic() - last_compact >= JANITOR_COMPACT_INTERVAL:
+                    last_compact = time.monotonic()
+                    await asyncio.to_thread(compact, session_engine())
+        except Exception:
+            logger.exception("Session janitor sweep failed")
+        await asyncio.sleep(JANITOR_INTERVAL)
+
+
+def start():
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(run_janitor())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+# ==========================================================
+# CLI
+# ==========================================================
+
+async def _cli(args):
+    from database import AsyncSessionLocal, migrate
+    from services import sharding
+
+    if args.shard is not None:
+        sharding.bind_shard(args.shard, migrate=True)
+    else:
+        migrate()
+
+    async with AsyncSessionLocal() as db:
+        report = await sweep(db, ttl=args.ttl, batch_size=args.batch_size, shard=args.shard)
+        if args.compact or args.vacuum:
+            report["compact"] = await asyncio.to_thread(compact, session_engine(), True if args.vacuum else None)
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ttl", type=float, default=SESSION_IDLE_TTL, help="idle seconds before a session expires")
+    parser.add_argument("--batch-size", type=int, default=JANITOR_BATCH_SIZE)
+    parser.add_argument("--compact", action="store_true", help="ANALYZE, and VACUUM if enough of the file is free")
+    parser.add_argument("--vacuum", action="store_true", help="ANALYZE and always VACUUM")
+    parser.add_argument("--shard", type=int, help="sweep this shard's session database")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,305 @@
-from sqlalchemy.orm import Session
-from models import ChatSession
-
-def get_or_create_session(db: Session, session_id: str):
-    session = db.query(ChatSession).filter_by(session_id=session_id).first()
-    if not session:
-        session = ChatSession(session_id=session_id, data={})  
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-    elif session.data is None:
-        session.data = {}
-        db.commit()
-    return session
\ No newline at end of file
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import (SESSION_ACTIVITY_RESOLUTION, SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_CACHE_VERIFY,
+                    SESSION_SNAPSHOT_EVERY)
+from models import ChatSession, SessionEvent
+from services.metrics import inc, span
+
+EVENTS = SessionEvent.__table__
+_MISSING = object()
+
+
+class SessionState:
+    """
+    In-memory state of a chat session. Flow code mutates it and sets
+    `dirty`; at the end of every turn the store appends what changed since
+    the last flush to the event log.
+    """
+
+    def __init__(self, id: int, session_id: str, action: Optional[str] = None,
+                 step: Optional[str] = None, data: Optional[Dict] = None,
+                 active_at: Optional[datetime] = None):
+        self.id = id
+        self.session_id = session_id
+        self.action = action
+        self.step = step
+        self.data = data if data is not None else {}
+        self.dirty = data is None
+        self.touched_at = time.monotonic()
+        self.active_at = active_at   # last_active_at as stored
+        self.tail = 0              # events written since the last snapshot
+        self.last_event_id = None  # newest event this state has seen (or written)
+        self.pending: List[Dict] = []
+        self.checked_out = False   # a turn is using it (SessionStore.checkout)
+        self.mark_saved()
+
+    def mark_saved(self):
+        self.saved = (self.action, self.step, dict(self.data))
+
+    def checkpoint(self):
+        """Queue the changes so far as events, so later changes in the same turn can't hide them."""
+        self.pending += diff_events(self)
+        self.mark_saved()
+
+    @classmethod
+    def from_row(cls, row: ChatSession) -> "SessionState":
+        return cls(row.id, row.session_id, row.action, row.step,
+                   dict(row.data) if row.data is not None else None, row.last_active_at)
+
+
+class SessionStore:
+    """
+    LRU cache with idle TTL in front of the chat_sessions table.
+    Dirty entries are never dropped without being flushed first, and
+    entries checked out by a turn are never dropped at all.
+
+    Turns go through checkout(), which holds a per-session asyncio.Lock
+    for the whole turn: two turns of one session run one after the other
+    on the same state, and an evicted state is flushed under that lock,
+    so a reload can't read the database before the flush lands.
+
+    The lock only covers this process. With `verify`, a cached state is
+    reused only while its last_event_id is still the session's newest
+    event, so a turn served by another process forces a reload.
+    """
+
+    def __init__(self, max_size: int, ttl: float, verify: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.verify = verify
+        self._entries: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        # session_id -> [lock, holders and waiters]; dropped when nobody uses it
+        self._session_locks: Dict[str, List] = {}
+
+    @asynccontextmanager
+    async def checkout(self, db: AsyncSession, session_id: str) -> AsyncIterator[SessionState]:
+        """The session's state for one turn, locked; its changes are flushed on the way out."""
+        async with self._locked(session_id):
+            with span("get_or_create_session"):
+                state = await self.get(db, session_id, check_out=True)
+            try:
+                yield state
+            finally:
+                try:
+                    await self.flush(db, state)
+                finally:
+                    state.checked_out = False
+
+    @asynccontextmanager
+    async def _locked(self, session_id: str):
+        entry = self._session_locks.get(session_id)
+        if entry is None:
+            entry = self._session_locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._session_locks[session_id]
+
+    async def get(self, db: AsyncSession, session_id: str, check_out: bool = False) -> SessionState:
+        # check_out marks the state before anything can be evicted, so a
+        # turn's own state is never flushed out from under it
+        now = time.monotonic()
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state and not state.dirty and not state.checked_out and now - state.touched_at > self.ttl:
+                del self._entries[session_id]
+                state = None
+            if state:
+                self._entries.move_to_end(session_id)
+                state.touched_at = now
+                state.checked_out = state.checked_out or check_out
+
+        stale = False
+        if state and self.verify and not state.dirty:
+            stale = await db.scalar(_last_event_query(state.id)) != state.last_event_id
+        if state and not stale:
+            inc("cache_requests_total", cache="session", result="hit")
+            return state
+
+        inc("cache_requests_total", cache="session", result="stale" if stale else "miss")
+
+        loaded = await self._load(db, session_id)
+
+        with self._lock:
+            if stale:
+                # Written by another process since we cached it
+                self._entries[session_id] = loaded
+            # Another request may have loaded the same session meanwhile
+            state = self._entries.setdefault(session_id, loaded)
+            self._entries.move_to_end(session_id)
+            state.checked_out = state.checked_out or check_out
+            evicted = self._pop_overflow()
+
+        for old in evicted:
+            async with self._locked(old.session_id):
+                await self.flush(db, old)
+        return state
+
+    async def flush(self, db: AsyncSession, state: SessionState):
+        now = datetime.utcnow()
+        stale = state.active_at is None or (now - state.active_at).total_seconds() >= SESSION_ACTIVITY_RESOLUTION
+        if not state.dirty and not stale:
+            return
+        events = state.pending + diff_events(state)
+        state.pending = []
+        if events:
+            ids = (await db.execute(insert(EVENTS).returning(EVENTS.c.id), events)).scalars().all()
+            state.last_event_id = max(ids)
+            state.tail += len(events)
+            inc("session_events_total", len(events))
+        if state.tail >= SESSION_SNAPSHOT_EVERY:
+            await _snapshot(db, state, now)
+        elif stale:
+            await db.execute(update(ChatSession).where(ChatSession.id == state.id).values(last_active_at=now))
+            state.active_at = now
+        if events or stale:
+            await db.commit()
+        state.mark_saved()
+        state.dirty = False
+
+    async def flush_all(self, db: AsyncSession):
+        with self._lock:
+            dirty = [s for s in self._entries.values() if s.dirty and not s.checked_out]
+        for state in dirty:
+            await self.flush(db, state)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard(self, session_ids: Iterable[str]):
+        """Forget sessions whose rows were deleted elsewhere (services/janitor.py)."""
+        with self._lock:
+            for session_id in session_ids:
+                self._entries.pop(session_id, None)
+
+    async def _load(self, db: AsyncSession, session_id: str) -> SessionState:
+        result = await db.execute(select(ChatSession).filter_by(session_id=session_id))
+        row = result.scalars().first()
+        if not row:
+            row = ChatSession(session_id=session_id, data={})
+            db.add(row)
+            await db.commit()
+            return SessionState.from_row(row)
+
+        state = SessionState.from_row(row)
+        tail = (await db.execute(_tail_query(row.id))).all()
+        for event in tail:
+            apply_event(state, event)
+        state.tail = len(tail)
+        state.last_event_id = await db.scalar(_last_event_query(row.id))
+        state.mark_saved()
+        return state
+
+    def _pop_overflow(self) -> List[SessionState]:
+        """Drop least recently used entries beyond max_size, skipping checked-out ones."""
+        evicted = []
+        excess = len(self._entries) - self.max_size
+        if excess <= 0:
+            return evicted
+        for session_id, state in list(self._entries.items()):
+            if state.checked_out:
+                continue
+            del self._entries[session_id]
+            evicted.append(state)
+            if len(evicted) == excess:
+                break
+        return evicted
+
+
+# ==========================================================
+# EVENT LOG
+# ==========================================================
+
+def diff_events(state: SessionState) -> List[Dict]:
+    """Event rows that turn the last saved state into the current one."""
+    action, step, data = state.saved
+    base = {"session_id": state.id, "action": state.action, "step": state.step}
+    events = []
+    if data.keys() - state.data.keys():
+        # Something was dropped: clear, then write back whatever is left
+        events.append(dict(base, kind="reset", field=None, value=None))
+        changed = list(state.data.items())
+    else:
+        changed = [(k, v) for k, v in state.data.items() if data.get(k, _MISSING) != v]
+    events += [dict(base, kind="set", field=k, value=v) for k, v in changed]
+    if not events and (state.action, state.step) != (action, step):
+        events.append(dict(base, kind="move", field=None, value=None))
+    return events
+
+
+def apply_event(state: SessionState, event):
+    if event.kind == "reset":
+        state.data = {}
+    elif event.kind == "set":
+        state.data[event.field] = event.value
+    state.action, state.step = event.action, event.step
+
+
+def _tail_query(session_pk: int):
+    """Events after the session's latest snapshot marker, oldest first."""
+    last_snapshot = (
+        select(EVENTS.c.id)
+        .where(EVENTS.c.session_id == session_pk, EVENTS.c.kind == "snapshot")
+        .order_by(EVENTS.c.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(EVENTS.c.kind, EVENTS.c.action, EVENTS.c.step, EVENTS.c.field, EVENTS.c.value)
+        .where(EVENTS.c.session_id == session_pk, EVENTS.c.kind != "snapshot")
+        .where(EVENTS.c.id > func.coalesce(last_snapshot, 0))
+        .order_by(EVENTS.c.id)
+    )
+
+
+def _last_event_query(session_pk: int):
+    return select(func.max(EVENTS.c.id)).where(EVENTS.c.session_id == session_pk)
+
+
+async def _snapshot(db: AsyncSession, state: SessionState, now: datetime):
+    # Row and marker go in the same transaction as the events they cover
+    await db.execute(
+        update(ChatSession)
+        .where(ChatSession.id == state.id)
+        .values(action=state.action, step=state.step, data=dict(state.data), last_active_at=now)
+    )
+    state.active_at = now
+    state.last_event_id = await db.scalar(
+        insert(EVENTS).returning(EVENTS.c.id),
+        {"session_id": state.id, "kind": "snapshot", "action": state.action, "step": state.step},
+    )
+    state.tail = 0
+    inc("session_snapshots_total")
+
+
+async def session_history(db: AsyncSession, session_id: str) -> List[Dict]:
+    """Every state change of a session, oldest first (snapshot markers included)."""
+    result = await db.execute(
+        select(EVENTS.c.kind, EVENTS.c.action, EVENTS.c.step, EVENTS.c.field, EVENTS.c.value,
+               EVENTS.c.created_at)
+        .join(ChatSession, ChatSession.id == EVENTS.c.session_id)
+        .where(ChatSession.session_id == session_id)
+        .order_by(EVENTS.c.id)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+session_store = SessionStore(SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_CACHE_VERIFY)
+
+
+def session_turn(db: AsyncSession, session_id: str):
+    """`async with session_turn(db, session_id) as state:` (see SessionStore.checkout)."""
+    return session_store.checkout(db, session_id)
@@ -0,0 +1,307 @@
+"""
+In-process instrumentation: timing spans, counters, and a Prometheus
+text exposition served at /metrics.
+
+    @timed("detect_action")              # sync or async function
+    with span("hubspot", call="create_deals"):
+        ...
+    inc("cache_requests_total", cache="session", result="hit")
+
+With METRICS_ENABLED=0, `timed` returns the function untouched, `span`
+hands back a shared no-op context, and `inc` returns straight away.
+
+PROFILE_DIR enables cProfile dumps. A request carrying PROFILE_HEADER is
+profiled with probability PROFILE_SAMPLE_RATE, and the stats are written
+to PROFILE_DIR/<time>-<pid>-<path>.prof (open them with pstats or snakeviz).
+cProfile sees the whole thread, so requests running concurrently show up
+in the same dump. Only one request is profiled at a time.
+
+Request timings and commit counts cover the handler up to the response
+headers, so the body of a streamed response is not included.
+
+Commits on every SQLAlchemy engine are counted, and the main engines'
+connection pools are reported at scrape time (chatbot_db_pool_*).
+
+In sharded mode every worker has its own registry, so scrape the worker
+ports, not the front router.
+"""
+import asyncio
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import METRICS_ENABLED, PROFILE_DIR, PROFILE_HEADER, PROFILE_SAMPLE_RATE
+
+PREFIX = "chatbot_"
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMIT_BUCKETS = (0, 1, 2, 3, 5, 10, 25)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[LabelKey, float]] = {}
+_histograms: Dict[str, "Histogram"] = {}
+_gauge_callbacks: List[Callable[[], List[Tuple[str, Dict[str, str], float]]]] = []
+
+_profiling = threading.Lock()
+
+# Commits made while handling the current request
+_request_commits: ContextVar[Optional[List[int]]] = ContextVar("request_commits", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series: Dict[LabelKey, List] = {}   # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, labels: LabelKey):
+        idx = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if idx < len(self.buckets):
+                series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+
+def _labels(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+_histograms["span_seconds"] = Histogram(BUCKETS)
+_histograms["request_seconds"] = Histogram(BUCKETS)
+
+
+# ==========================================================
+# RECORDING
+# ==========================================================
+
+def inc(name: str, amount: float = 1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def observe(name: str, value: float, buckets=BUCKETS, **labels):
+    if not METRICS_ENABLED:
+        return
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = _histograms.setdefault(name, Histogram(buckets))
+    hist.observe(value, _labels(labels))
+
+
+class _Span:
+    __slots__ = ("labels", "start")
+
+    def __init__(self, labels: LabelKey):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _histograms["span_seconds"].observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def span(name: str, **labels):
+    """Time a block into the span_seconds histogram."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(_labels(dict(labels, span=name)))
+
+
+def timed(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        labels = _labels({"span": name})
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _Span(labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def gauges(callback: Callable[[], List[Tuple[str, Dict[str, str], float]]]):
+    """Register a callback that reports (name, labels, value) at scrape time."""
+    _gauge_callbacks.append(callback)
+    return callback
+
+
+def count_commit(*_):
+    """SQLAlchemy "commit" event listener."""
+    if not METRICS_ENABLED:
+        return
+    inc("db_commits_total")
+    commits = _request_commits.get()
+    if commits is not None:
+        commits[0] += 1
+
+
+# Listening on the Engine class covers every engine, including ones created later
+if METRICS_ENABLED:
+    event.listen(Engine, "commit", count_commit)
+
+
+@gauges
+def _db_pools():
+    # Imported at scrape time: database imports nothing from here
+    from database import async_engine, engine
+
+    report = []
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        for metric in ("size", "checkedout", "overflow"):
+            value = getattr(pool, metric, None)
+            if value is not None:
+                report.append((f"db_pool_{metric}", {"engine": name}, value()))
+    return report
+
+
+def lru_cache_gauges(name: str, cached_fn) -> Callable:
+    """Expose an lru_cache's hit/miss counts without touching its hot path."""
+    def report():
+        info = cached_fn.cache_info()
+        return [
+            ("cache_requests_total", {"cache": name, "result": "hit"}, info.hits),
+            ("cache_requests_total", {"cache": name, "result": "miss"}, info.misses),
+            ("cache_entries", {"cache": name}, info.currsize),
+        ]
+    return gauges(report)
+
+
+# ==========================================================
+# EXPOSITION
+# ==========================================================
+
+def _fmt_labels(labels, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        histograms = {name: (h.buckets, {k: (list(v[0]), v[1], v[2]) for k, v in h.series.items()})
+                      for name, h in _histograms.items()}
+
+    # lru_cache hit/miss totals are reported as counters even though they are read at scrape time
+    scraped: Dict[str, Dict[LabelKey, float]] = {}
+    for callback in _gauge_callbacks:
+        for name, labels, value in callback():
+            scraped.setdefault(name, {})[_labels(labels)] = value
+    for name, series in scraped.items():
+        counters.setdefault(name, {}).update(series)
+
+    for name in sorted(counters):
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {_num(value)}")
+
+    for name in sorted(histograms):
+        buckets, series = histograms[name]
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, (('le', _num(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_fmt_labels(labels)} {_num(total)}")
+            lines.append(f"{PREFIX}{name}_count{_fmt_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================================
+# HTTP MIDDLEWARE
+# ==========================================================
+
+def install(app):
+    """Per-request timing and commit counts, plus header-triggered profiling."""
+    if not METRICS_ENABLED and not PROFILE_DIR:
+        return
+
+    @app.middleware("http")
+    async def instrument(request, call_next):
+        profiler = _maybe_profiler(request)
+        commits = [0]
+        token = _request_commits.set(commits)
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                response = await call_next(request)
+            else:
+                profiler.enable()
+                try:
+                    response = await call_next(request)
+                finally:
+                    profiler.disable()
+                    _profiling.release()
+                    _dump(profiler, request.url.path)
+        finally:
+            _request_commits.reset(token)
+        if METRICS_ENABLED:
+            # Label by endpoint, not raw path, so path parameters don't explode cardinality
+            endpoint = getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+            labels = _labels({"endpoint": endpoint, "method": request.method})
+            _histograms["request_seconds"].observe(time.perf_counter() - start, labels)
+            inc("requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+            observe("db_commits_per_request", commits[0], COMMIT_BUCKETS, endpoint=endpoint)
+        return response
+
+
+def _maybe_profiler(request) -> Optional[cProfile.Profile]:
+    if not PROFILE_DIR or PROFILE_HEADER not in request.headers:
+        return None
+    if random.random() >= PROFILE_SAMPLE_RATE or not _profiling.acquire(blocking=False):
+        return None
+    return cProfile.Profile()
+
+
+def _dump(profiler: cProfile.Profile, path: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = path.strip("/").replace("/", "_") or "root"
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f".{time.time_ns() % 10**9:09d}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{stamp}-{os.getpid()}-{name}.prof"))
+
@@ -0,0 +1,226 @@
+"""
+Transactional outbox for HubSpot sync.
+
+finalize_action commits an OutboxEvent together with the contract change,
+and a background worker drains the table in batches. Events are claimed
+with a lease, so a worker that dies mid-batch has its events picked up
+again once the lease runs out (delivery is at-least-once).
+
+    python -m services.outbox        # run the worker as its own process
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE, OUTBOX_MAX_ATTEMPTS
+from database import AsyncSessionLocal
+from models import Contract, OutboxEvent
+from services import aggregates
+
+logger = logging.getLogger(__name__)
+
+CREATE_DEAL = "CREATE_DEAL"
+UPDATE_PHONE = "UPDATE_PHONE"
+
+_wakeup: Optional[asyncio.Event] = None
+_worker: Optional[asyncio.Task] = None
+_waiters: Dict[int, List[asyncio.Future]] = {}
+
+
+def enqueue(db: AsyncSession, contract_id: int, operation: str, payload: Dict) -> OutboxEvent:
+    """Add an event to the caller's transaction; it is sent once that commits."""
+    event = OutboxEvent(contract_id=contract_id, operation=operation, payload=payload)
+    db.add(event)
+    return event
+
+
+def notify():
+    """Wake the worker instead of waiting for the next poll."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def wait_for(db: AsyncSession, event_id: int, timeout: float) -> Optional[Dict]:
+    """
+    Wait until an event is DONE or FAILED and return {"status", "result"},
+    or None on timeout. An in-process worker wakes the waiter right away;
+    when the worker runs elsewhere (another shard or process) the row is
+    re-read every OUTBOX_POLL_INTERVAL.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    future = loop.create_future()
+    _waiters.setdefault(event_id, []).append(future)
+    try:
+        while True:
+            event = await db.get(OutboxEvent, event_id, populate_existing=True)
+            if event is not None and event.status in ("DONE", "FAILED"):
+                return _outcome(event)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), min(remaining, OUTBOX_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        waiters = _waiters.get(event_id, [])
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            _waiters.pop(event_id, None)
+
+
+def _outcome(event: OutboxEvent) -> Dict:
+    return {"status": event.status, "result": event.result}
+
+
+def _resolve_waiters(events: List[OutboxEvent]):
+    for event in events:
+        if event.status not in ("DONE", "FAILED"):
+            continue
+        for future in _waiters.get(event.id, []):
+            if not future.done():
+                future.set_result(_outcome(event))
+
+
+# ==========================================================
+# DRAINING
+# ==========================================================
+
+async def drain_once(db: AsyncSession, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    events = await _claim(db, limit)
+    for operation in (CREATE_DEAL, UPDATE_PHONE):
+        batch = [e for e in events if e.operation == operation]
+        if batch:
+            await _deliver(db, operation, batch)
+    await db.commit()
+    _resolve_waiters(events)
+    return len(events)
+
+
+async def _claim(db: AsyncSession, limit: int) -> List[OutboxEvent]:
+    """
+    Lease up to `limit` due events. The lease is a conditional UPDATE that
+    re-checks status and available_at, so when several drainers pick the
+    same candidates (SQLite ignores FOR UPDATE SKIP LOCKED) each event is
+    won by exactly one of them; only the ids it returned are delivered.
+    """
+    now = datetime.utcnow()
+    due = (OutboxEvent.status.in_(("PENDING", "IN_FLIGHT")), OutboxEvent.available_at <= now)
+    candidates = (await db.scalars(
+        select(OutboxEvent.id).where(*due).order_by(OutboxEvent.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    )).all()
+    if not candidates:
+        await db.commit()
+        return []
+    won = (await db.scalars(
+        update(OutboxEvent).where(OutboxEvent.id.in_(candidates), *due)
+        .values(status="IN_FLIGHT", available_at=now + timedelta(seconds=OUTBOX_LEASE))
+        .returning(OutboxEvent.id)
+    )).all()
+    await db.commit()
+    if not won:
+        return []
+    result = await db.scalars(
+        select(OutboxEvent).where(OutboxEvent.id.in_(won)).order_by(OutboxEvent.id)
+        .execution_options(populate_existing=True)
+    )
+    return list(result)
+
+
+async def _deliver(db: AsyncSession, operation: str, events: List[OutboxEvent]):
+    # Imported on first delivery: the HTTP client stack is not needed to serve chat turns
+    from services.tools.hubspot import create_deals, update_phones
+
+    try:
+        if operation == CREATE_DEAL:
+            results = await create_deals([e.payload for e in events])
+        else:
+            results = await update_phones([(e.contract_id, e.payload["phone"]) for e in events])
+    except Exception as e:
+        logger.warning("HubSpot %s batch of %d failed: %s", operation, len(events), e)
+        for event in events:
+            await _fail(db, event, str(e))
+        return
+
+    # One result per event in event order; anything HubSpot did not confirm is retried
+    if len(results) != len(events):
+        results = [{"success": False, "error": f"{len(results)} results for {len(events)} events"}] * len(events)
+    delivered = []
+    for event, result in zip(events, results):
+        if not result.get("success"):
+            await _fail(db, event, str(result.get("error")))
+            continue
+        event.status = "DONE"
+        event.result = result
+        event.last_error = None
+        delivered.append(event.contract_id)
+    if operation == CREATE_DEAL and delivered:
+        await aggregates.update_where(
+            db, Contract.__table__, Contract.id.in_(delivered), {"status": "COMPLETED"}
+        )
+
+
+async def _fail(db: AsyncSession, event: OutboxEvent, error: str):
+    event.attempts = (event.attempts or 0) + 1
+    event.last_error = error
+    if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+        event.status = "FAILED"
+        if event.operation == CREATE_DEAL:
+            await aggregates.update_where(
+                db, Contract.__table__, Contract.id == event.contract_id, {"status": "SYNC_FAILED"}
+            )
+    else:
+        event.status = "PENDING"
+        delay = min(2 ** event.attempts, 300)
+        event.available_at = datetime.utcnow() + timedelta(seconds=delay)
+
+
+# ==========================================================
+# WORKER
+# ==========================================================
+
+async def run_worker():
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                drained = await drain_once(db)
+        except Exception:
+            logger.exception("Outbox drain failed")
+            drained = 0
+
+        # A full batch means there is probably more waiting
+        if drained < OUTBOX_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+
+def start_worker():
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(run_worker())
+
+
+async def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
@@ -0,0 +1,27 @@
+"""
+Progress events for streamed chat turns.
+
+Pipeline code calls emit(); whoever runs the turn inside listen() gets the
+events. With no listener, emit() is a no-op, so the plain /chat path pays
+nothing for it.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+_listener: ContextVar[Optional[Callable[[str, Dict], None]]] = ContextVar("progress_listener", default=None)
+
+
+def emit(stage: str, **info):
+    listener = _listener.get()
+    if listener is not None:
+        listener(stage, info)
+
+
+@contextmanager
+def listen(callback: Callable[[str, Dict], None]):
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
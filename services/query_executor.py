@@ -0,0 +1,195 @@
+"""
+Run parsed filters against the local database.
+
+The same FilterQuery AST that FilterBuilder renders for Supabase is
+compiled here into parameterized SQLAlchemy Core statements. Only
+contexts whose table lives in our own metadata (e.g. CONTRACTS) can be
+executed.
+"""
+import atexit
+import json
+import logging
+import operator
+import queue
+import threading
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import AsyncIterator, Dict, Optional, Tuple
+from sqlalchemy import Table, and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import FILTER_USAGE_LOG
+from database import Base
+import models  # noqa: F401  (registers tables on Base)
+from services import aggregates
+from services.filter_builder import Condition, FilterQuery, PLAN_CACHE_SIZE, get_filter_builder
+from services.metrics import lru_cache_gauges
+
+DEFAULT_PAGE_SIZE = 100
+STREAM_CHUNK_SIZE = 500
+
+OPERATORS = {
+    "eq": operator.eq,
+    "neq": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+}
+
+
+def get_table(context_key: str) -> Table:
+    builder = get_filter_builder(context_key.upper())
+    table = Base.metadata.tables.get(builder.table_name)
+    if table is None:
+        raise ValueError(f"Context '{context_key}' cannot be executed locally")
+    return table
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_filter(context_key: str, query: str) -> Tuple[FilterQuery, object]:
+    """
+    Parse and compile a filter once; the statement carries bound
+    parameters and is reused for every page of every later request.
+    """
+    q = get_filter_builder(context_key.upper()).parse(query)
+    table = get_table(context_key)
+    where = _where(table, q)
+
+    if q.kind == "update":
+        if not q.updates or where is None:
+            raise ValueError("Invalid UPDATE query. SET or WHERE clause missing")
+        return q, update(table).where(where).values(**q.updates)
+
+    if q.kind == "count":
+        stmt = select(func.count().label("count")).select_from(table)
+    elif q.kind in ("avg", "max", "min"):
+        if not q.column:
+            raise ValueError(f"{q.kind.upper()} query needs a column")
+        agg = getattr(func, q.kind)(table.c[q.column]).label(q.kind)
+        stmt = select(agg)
+    else:
+        stmt = select(table)
+        if q.order:
+            col, desc = q.order
+            stmt = stmt.order_by(table.c[col].desc() if desc else table.c[col])
+        else:
+            stmt = stmt.order_by(*table.primary_key.columns)
+
+    if where is not None:
+        stmt = stmt.where(where)
+    return q, stmt
+
+
+lru_cache_gauges("compiled_filter", compile_filter)
+
+
+async def execute_filter(db: AsyncSession, context_key: str, query: str,
+                         limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> Dict:
+    """
+    Execute one page. SELECTs return `rows` and `next_offset` (None on the
+    last page); UPDATEs commit and return `rowcount`. Count/avg/min/max
+    are answered from services/aggregates.py when it tracks them.
+    """
+    q, stmt = compile_filter(context_key, query)
+    log_usage(context_key, query, q)
+
+    if q.kind == "update":
+        rowcount = await aggregates.update_where(db, get_table(context_key), stmt.whereclause, q.updates)
+        await db.commit()
+        return {"rowcount": rowcount}
+
+    if q.kind != "select":
+        row = await aggregates.lookup(db, get_table(context_key), q)
+        if row is None:
+            row = dict((await db.execute(stmt)).mappings().one())
+        return {"rows": [row], "next_offset": None}
+
+    if q.limit is not None:
+        limit = min(limit, q.limit - offset)
+        if limit <= 0:
+            return {"rows": [], "next_offset": None}
+
+    # Fetch one extra row to know whether another page exists
+    result = await db.execute(stmt.limit(limit + 1).offset(offset))
+    rows = [dict(r) for r in result.mappings()]
+    has_more = len(rows) > limit
+    return {
+        "rows": rows[:limit],
+        "next_offset": offset + limit if has_more else None,
+    }
+
+
+async def stream_filter(db: AsyncSession, context_key: str, query: str) -> AsyncIterator[Dict]:
+    """Yield every matching row through a server-side cursor."""
+    q, stmt = compile_filter(context_key, query)
+    if q.kind == "update":
+        raise ValueError("UPDATE queries cannot be streamed")
+    log_usage(context_key, query, q)
+    if q.kind != "select":
+        row = await aggregates.lookup(db, get_table(context_key), q)
+        if row is not None:
+            yield row
+            return
+    elif q.limit is not None:
+        stmt = stmt.limit(q.limit)
+
+    result = await db.stream(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+    async for row in result.mappings():
+        yield dict(row)
+
+
+_usage_logger: Optional[logging.Logger] = None
+_usage_lock = threading.Lock()
+
+
+def _get_usage_logger() -> logging.Logger:
+    """
+    Logger whose records are only queued on the request path; a
+    QueueListener thread does the file writes.
+    """
+    global _usage_logger
+    with _usage_lock:
+        if _usage_logger is None:
+            handler = logging.FileHandler(FILTER_USAGE_LOG, delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            records: queue.SimpleQueue = queue.SimpleQueue()
+            listener = QueueListener(records, handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            logger = logging.getLogger("chatbot.filter_usage")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(QueueHandler(records))
+            _usage_logger = logger
+    return _usage_logger
+
+
+def log_usage(context_key: str, query: str, q: FilterQuery):
+    """Append the executed filter's shape to FILTER_USAGE_LOG, if configured."""
+    if not FILTER_USAGE_LOG:
+        return
+    entry = {
+        "context": context_key.upper(),
+        "query": query,
+        "kind": q.kind,
+        "where": [[[c.column, c.op] for c in group] for group in q.where],
+        "order": q.order[0] if q.order else None,
+    }
+    _get_usage_logger().info(json.dumps(entry))
+
+
+def _where(table: Table, q: FilterQuery) -> Optional[object]:
+    if not q.where:
+        return None
+    groups = [and_(*(_condition(table, c) for c in group)) for group in q.where]
+    return groups[0] if len(groups) == 1 else or_(*groups)
+
+
+def _condition(table: Table, c: Condition):
+    col = table.c[c.column]
+    if c.op == "ilike":
+        # The value is matched literally: % and _ in it are not wildcards
+        value = str(c.value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return col.ilike(f"%{value}%", escape="\\")
+    return OPERATORS[c.op](col, c.value)
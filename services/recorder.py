@@ -0,0 +1,30 @@
+"""
+Record chat turns to CHAT_RECORD_LOG (JSONL) so real traffic can be
+replayed with bench/replay.py. One line per turn:
+
+    {"t": <unix time>, "session_id", "message", "context", "idempotency_key", "reply"}
+"""
+import json
+import threading
+from config import CHAT_RECORD_LOG
+
+_file = None
+_lock = threading.Lock()
+
+
+def record_turn(t: float, session_id: str, message: str, context, idempotency_key, reply):
+    global _file
+    if not CHAT_RECORD_LOG:
+        return
+    entry = {
+        "t": round(t, 6),
+        "session_id": session_id,
+        "message": message,
+        "context": context,
+        "idempotency_key": idempotency_key,
+        "reply": reply,
+    }
+    with _lock:
+        if _file is None:
+            _file = open(CHAT_RECORD_LOG, "a", buffering=1)
+        _file.write(json.dumps(entry, default=str) + "\n")
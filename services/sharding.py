@@ -0,0 +1,267 @@
+"""
+Sharded deployment: one worker process per shard behind a front router.
+
+A session_id always hashes to the same shard, so its in-memory
+SessionState (services/memory.py) lives in exactly one process. Each
+worker keeps the chat_sessions rows and session events of its sessions
+in its own database (SESSION_SHARD_URL), which keeps per-turn session
+writes from fighting over one SQLite file. Contracts, the outbox and filters stay in the
+shared DATABASE_URL, and only shard 0 runs the outbox worker. In this
+mode contracts.session_id is the row id inside the owning shard's
+database (recorded in contracts.session_shard), so it is not a foreign
+key. Databases created before it was dropped may still carry one; the
+launcher and the workers refuse to start if the shared database
+enforces it.
+
+    python -m services.sharding --workers 4 --port 8000
+
+The front router forwards /chat and /chat/stream by session_id and sends
+everything else (/api/...) round robin. WebSocket clients ask
+GET /shards/route/{session_id} for their worker and connect to it
+directly. GET /shards collects every worker's /shard/stats.
+
+Changing SHARD_COUNT remaps sessions to other shards, so their saved
+state is not found. Keep the count fixed for a deployment's lifetime.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from config import DB_AUTO_MIGRATE, SHARD_BASE_PORT, SHARD_COUNT, SHARD_HOST, SHARD_INDEX, SESSION_SHARD_URL
+from services.tools.hubspot import LatencyStats
+
+
+def shard_for(session_id: str, count: int = SHARD_COUNT) -> int:
+    """Stable across processes and restarts, unlike hash()."""
+    digest = hashlib.blake2b(session_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+# ==========================================================
+# WORKER SIDE
+# ==========================================================
+
+stats = LatencyStats()
+_in_flight = 0
+
+
+def migrate_shard(engine):
+    """Create the session tables (and missing columns) in a shard's database."""
+    from database import add_missing_columns
+    from models import ChatSession, SessionEvent
+
+    tables = [ChatSession.__table__, SessionEvent.__table__]
+    for table in tables:
+        table.create(engine, checkfirst=True)
+    add_missing_columns(engine, tables)
+
+
+def check_shared_database(engine=None):
+    """Raise if contracts.session_id is still an enforced foreign key to chat_sessions."""
+    from sqlalchemy import inspect
+    from database import engine as default_engine
+
+    engine = engine or default_engine
+    fks = [fk for fk in inspect(engine).get_foreign_keys("contracts")
+           if fk["referred_table"] == "chat_sessions"]
+    if not fks:
+        return
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            if not conn.exec_driver_sql("PRAGMA foreign_keys").scalar():
+                return
+    raise RuntimeError(
+        f"contracts.session_id references chat_sessions ({fks[0].get('name') or 'unnamed constraint'}), "
+        "but in sharded mode it holds shard-local ids: drop that foreign key before starting shards"
+    )
+
+
+def bind_shard(shard: int, migrate: bool = DB_AUTO_MIGRATE):
+    """Point chat_sessions and their event log at `shard`'s database (migrated first if `migrate`)."""
+    from database import AsyncSessionLocal, SessionLocal, create_engines
+    from models import ChatSession, SessionEvent
+
+    engine, async_engine = create_engines(SESSION_SHARD_URL.format(shard=shard))
+    if migrate:
+        migrate_shard(engine)
+    SessionLocal.configure(binds={ChatSession: engine, SessionEvent: engine})
+    AsyncSessionLocal.configure(binds={ChatSession: async_engine, SessionEvent: async_engine})
+    return engine
+
+
+def configure_worker(app: FastAPI, shard: int = SHARD_INDEX):
+    """Bind the session tables to this shard's database and expose /shard/stats."""
+    from services.memory import session_store
+
+    check_shared_database()
+    bind_shard(shard)
+
+    @app.middleware("http")
+    async def count_requests(request: Request, call_next):
+        global _in_flight
+        _in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            _in_flight -= 1
+            elapsed = (time.perf_counter() - start) * 1000
+            stats.calls += 1
+            stats.total_ms += elapsed
+            stats.max_ms = max(stats.max_ms, elapsed)
+        if response.status_code >= 500:
+            stats.errors += 1
+        return response
+
+    @app.get("/shard/stats")
+    async def shard_stats():
+        return {
+            "shard": shard,
+            "pid": os.getpid(),
+            "in_flight": _in_flight,
+            "sessions_cached": len(session_store._entries),
+            "requests": stats.as_dict(),
+        }
+
+
+# ==========================================================
+# FRONT ROUTER
+# ==========================================================
+
+worker_urls: List[str] = [f"http://{SHARD_HOST}:{SHARD_BASE_PORT + i}" for i in range(SHARD_COUNT)]
+_round_robin = itertools.count()
+_http: Optional[httpx.AsyncClient] = None
+
+# Hop-by-hop headers are not forwarded
+_DROP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding"}
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    global _http
+    _http = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_keepalive_connections=100))
+    yield
+    await _http.aclose()
+
+
+front = FastAPI(title="Chatbot shard router", lifespan=_lifespan)
+
+
+@front.get("/shards")
+async def shards():
+    async def one(url):
+        try:
+            resp = await _http.get(f"{url}/shard/stats", timeout=5)
+            return resp.json()
+        except httpx.HTTPError as e:
+            return {"url": url, "error": str(e)}
+    return {"workers": await asyncio.gather(*(one(url) for url in worker_urls))}
+
+
+@front.get("/shards/route/{session_id}")
+async def route(session_id: str):
+    shard = shard_for(session_id, len(worker_urls))
+    return {"shard": shard, "url": worker_urls[shard]}
+
+
+@front.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def forward(path: str, request: Request):
+    body = await request.body()
+    target = _pick_worker(path, body)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _DROP_HEADERS}
+
+    upstream = await _http.send(
+        _http.build_request(request.method, f"{target}/{path}", params=request.query_params,
+                            headers=headers, content=body),
+        stream=True,
+    )
+    out_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in _DROP_HEADERS}
+
+    if upstream.headers.get("content-type", "").startswith(("text/event-stream", "application/x-ndjson")):
+        async def relay():
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await upstream.aclose()
+        return StreamingResponse(relay(), status_code=upstream.status_code, headers=out_headers)
+
+    content = await upstream.aread()
+    await upstream.aclose()
+    return Response(content, status_code=upstream.status_code, headers=out_headers)
+
+
+def _pick_worker(path: str, body: bytes) -> str:
+    if path in ("chat", "chat/stream"):
+        session_id = _session_id(body)
+        if session_id is not None:
+            return worker_urls[shard_for(session_id, len(worker_urls))]
+    return worker_urls[next(_round_robin) % len(worker_urls)]
+
+
+def _session_id(body: bytes) -> Optional[str]:
+    try:
+        session_id = json.loads(body).get("session_id")
+    except (ValueError, AttributeError):
+        return None
+    return session_id if isinstance(session_id, str) else None
+
+
+# ==========================================================
+# LAUNCHER
+# ==========================================================
+
+def spawn_workers(count: int, host: str = SHARD_HOST, base_port: int = SHARD_BASE_PORT) -> List[subprocess.Popen]:
+    procs = []
+    for i in range(count):
+        env: Dict[str, str] = dict(os.environ, SHARD_COUNT=str(count), SHARD_INDEX=str(i))
+        if i != 0:
+            env["OUTBOX_WORKER_ENABLED"] = "0"
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(base_port + i)],
+            env=env,
+        ))
+    return procs
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=max(SHARD_COUNT, os.cpu_count() or 1))
+    parser.add_argument("--host", default="0.0.0.0", help="front router host")
+    parser.add_argument("--port", type=int, default=8000, help="front router port")
+    args = parser.parse_args()
+
+    # Create the shared tables once, before the workers race to do it
+    if DB_AUTO_MIGRATE:
+        from database import migrate
+        migrate()
+    check_shared_database()
+
+    worker_urls[:] = [f"http://{SHARD_HOST}:{SHARD_BASE_PORT + i}" for i in range(args.workers)]
+    procs = spawn_workers(args.workers)
+    try:
+        uvicorn.run(front, host=args.host, port=args.port)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Minimal stand-in for the HubSpot CRM API, for running offline.
+
+    uvicorn services.tools.fake_hubspot:app --port 8081
+    HUBSPOT_BASE_URL=http://127.0.0.1:8081 HUBSPOT_ACCESS_TOKEN=test uvicorn main:app
+
+Set FAKE_HUBSPOT_429_EVERY=N to answer every Nth request with a 429,
+which exercises the client's retry path. Batch results echo each input's
+objectWriteTraceId, and a batch where some inputs fail is answered with
+a 207 listing them under `errors`.
+"""
+import itertools
+import os
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake HubSpot")
+
+FAIL_EVERY = int(os.getenv("FAKE_HUBSPOT_429_EVERY", 0))
+
+_ids = itertools.count(1)
+_requests = itertools.count(1)
+deals = {}
+contacts = {}
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    if FAIL_EVERY and next(_requests) % FAIL_EVERY == 0:
+        return JSONResponse({"status": "error", "category": "RATE_LIMITS"}, 429,
+                            headers={"Retry-After": "0"})
+    return await call_next(request)
+
+
+def _create_deal(properties: dict) -> dict:
+    deal_id = str(next(_ids))
+    deals[deal_id] = properties
+    return {"id": deal_id, "properties": properties}
+
+
+def _update_contact(contact_id: str, id_property: str, properties: dict) -> dict:
+    if not contact_id:
+        raise HTTPException(404, "Contact not found")
+    contact = contacts.setdefault((id_property, contact_id), {})
+    contact.update(properties)
+    return {"id": contact_id, "properties": contact}
+
+
+@app.post("/crm/v3/objects/deals", status_code=201)
+async def create_deal(body: dict):
+    return _create_deal(body.get("properties", {}))
+
+
+def _batch(inputs: list, apply, status_code: int) -> JSONResponse:
+    results, errors = [], []
+    for i in inputs:
+        trace_id = i.get("objectWriteTraceId")
+        try:
+            result = apply(i)
+        except HTTPException as e:
+            errors.append({"status": "error", "category": "OBJECT_NOT_FOUND", "message": e.detail,
+                           "context": {"objectWriteTraceId": [trace_id]}})
+            continue
+        results.append(dict(result, objectWriteTraceId=trace_id))
+    body = {"status": "COMPLETE", "results": results}
+    if errors:
+        body.update(errors=errors, numErrors=len(errors))
+        status_code = 207
+    return JSONResponse(body, status_code)
+
+
+@app.post("/crm/v3/objects/deals/batch/create")
+async def create_deals(body: dict):
+    return _batch(body.get("inputs", []), lambda i: _create_deal(i.get("properties", {})), 201)
+
+
+@app.patch("/crm/v3/objects/contacts/{contact_id}")
+async def update_contact(contact_id: str, body: dict, idProperty: str = "hs_object_id"):
+    return _update_contact(contact_id, idProperty, body.get("properties", {}))
+
+
+@app.post("/crm/v3/objects/contacts/batch/update")
+async def update_contacts(body: dict):
+    return _batch(
+        body.get("inputs", []),
+        lambda i: _update_contact(i["id"], i.get("idProperty", "hs_object_id"), i.get("properties", {})),
+        200,
+    )
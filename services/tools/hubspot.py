@@ -1,5 +1,318 @@
-def create_deal(data):
-    return {"success": True, "deal_id": 9876}
+import asyncio
+import random
+import time
+from typing import Callable, Dict, List, Optional
+import httpx
+from services.metrics import inc, observe
+from config import (
+    HUBSPOT_ACCESS_TOKEN, HUBSPOT_BASE_URL, HUBSPOT_TIMEOUT, HUBSPOT_MAX_CONNECTIONS,
+    HUBSPOT_RATE_LIMIT, HUBSPOT_RATE_BURST, HUBSPOT_MAX_RETRIES,
+    HUBSPOT_BATCH_SIZE, HUBSPOT_BATCH_WINDOW,
+)
 
-def update_phone(contract_id, phone):
-    return {"success": True}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HubSpotBatchError(Exception):
+    """An item of a batch call that HubSpot rejected or returned no result for."""
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, up to `burst` at once
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LatencyStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects single items into one batch call. A batch is sent when it
+    reaches `max_size` or `window` seconds after its first item arrived.
+    """
+
+    def __init__(self, send_batch: Callable, max_size: int, window: float):
+        self.send_batch = send_batch
+        self.max_size = max_size
+        self.window = window
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending = set()
+
+    async def submit(self, item) -> Dict:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Send in the background so the next batch can start filling
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        try:
+            results = await self.send_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if len(results) != len(batch):
+            error = HubSpotBatchError(f"{len(results)} results for a batch of {len(batch)}")
+            results = [{"success": False, "error": str(error)}] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result.get("success"):
+                future.set_result(result)
+            else:
+                future.set_exception(HubSpotBatchError(result.get("error")))
+
+
+class HubSpotClient:
+    """
+    HubSpot CRM client with a persistent connection pool, client-side
+    rate limiting, retries with exponential backoff and per-call latency
+    stats. Single deal creates and phone updates are micro-batched onto
+    the HubSpot batch endpoints.
+    """
+
+    def __init__(self, base_url: str = HUBSPOT_BASE_URL, token: str = HUBSPOT_ACCESS_TOKEN,
+                 max_retries: int = HUBSPOT_MAX_RETRIES):
+        self.base_url = base_url
+        self.token = token
+        self.max_retries = max_retries
+        self.metrics: Dict[str, LatencyStats] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._deal_batcher = MicroBatcher(self.create_deals, HUBSPOT_BATCH_SIZE, HUBSPOT_BATCH_WINDOW)
+        self._phone_batcher = MicroBatcher(self.update_phones, HUBSPOT_BATCH_SIZE, HUBSPOT_BATCH_WINDOW)
+
+    # ---------- single-item API ----------
+
+    async def create_deal(self, data: Dict) -> Dict:
+        return await self._deal_batcher.submit(data)
+
+    async def update_phone(self, contract_id, phone: str) -> Dict:
+        return await self._phone_batcher.submit((contract_id, phone))
+
+    # ---------- batch API ----------
+
+    # Both return one entry per item, in item order: {"success": True, ...}
+    # or {"success": False, "error": ...}. HubSpot does not promise result
+    # order, so every input carries its index as objectWriteTraceId and
+    # results are matched on that.
+
+    async def create_deals(self, items: List[Dict]) -> List[Dict]:
+        resp = await self._request("create_deals", "POST", "/crm/v3/objects/deals/batch/create", json={
+            "inputs": [
+                {"objectWriteTraceId": str(i), "properties": _deal_properties(data)}
+                for i, data in enumerate(items)
+            ]
+        })
+        return _match_results(len(items), resp.json(), lambda r: {"success": True, "deal_id": r["id"]})
+
+    async def update_phones(self, items: List[tuple]) -> List[Dict]:
+        resp = await self._request("update_phones", "POST", "/crm/v3/objects/contacts/batch/update", json={
+            "inputs": [
+                {"objectWriteTraceId": str(i), "id": str(contract_id), "idProperty": "contract_id",
+                 "properties": {"phone": phone}}
+                for i, (contract_id, phone) in enumerate(items)
+            ]
+        })
+        return _match_results(len(items), resp.json(), lambda r: {"success": True})
+
+    # ---------- plumbing ----------
+
+    async def close(self):
+        await self._deal_batcher.close()
+        await self._phone_batcher.close()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def get_metrics(self) -> Dict:
+        return {name: stats.as_dict() for name, stats in self.metrics.items()}
+
+    async def _request(self, name: str, method: str, path: str, **kwargs) -> httpx.Response:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=HUBSPOT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HUBSPOT_MAX_CONNECTIONS,
+                    max_keepalive_connections=HUBSPOT_MAX_CONNECTIONS,
+                ),
+            )
+            self._bucket = TokenBucket(HUBSPOT_RATE_LIMIT, HUBSPOT_RATE_BURST)
+
+        stats = self.metrics.setdefault(name, LatencyStats())
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._bucket.acquire()
+                resp = None
+                try:
+                    resp = await self._http.request(method, path, **kwargs)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        resp.raise_for_status()
+                        return resp
+                stats.retries += 1
+                inc("hubspot_retries_total", call=name)
+                await asyncio.sleep(_backoff(attempt, resp))
+        except Exception:
+            stats.errors += 1
+            inc("hubspot_errors_total", call=name)
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            stats.calls += 1
+            stats.total_ms += elapsed
+            stats.max_ms = max(stats.max_ms, elapsed)
+            observe("span_seconds", elapsed / 1000, span="hubspot", call=name)
+
+
+def _backoff(attempt: int, resp: Optional[httpx.Response]) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return min(0.25 * 2 ** attempt, 8.0) * (0.5 + random.random() / 2)
+
+
+def _match_results(count: int, body: Dict, success: Callable) -> List[Dict]:
+    """
+    Line up a batch response with its inputs by objectWriteTraceId. Items
+    named in the `errors` of a 207 get that error; items with neither a
+    result nor an error are failed too, never guessed at.
+    """
+    matched: List[Optional[Dict]] = [None] * count
+
+    def index(trace_id) -> Optional[int]:
+        if isinstance(trace_id, str) and trace_id.isdigit() and int(trace_id) < count:
+            return int(trace_id)
+        return None
+
+    for error in body.get("errors") or ():
+        message = error.get("message") or error.get("category") or "batch item failed"
+        for trace_id in (error.get("context") or {}).get("objectWriteTraceId", ()):
+            i = index(trace_id)
+            if i is not None:
+                matched[i] = {"success": False, "error": message}
+    for result in body.get("results") or ():
+        i = index(result.get("objectWriteTraceId"))
+        if i is not None:
+            matched[i] = success(result)
+
+    matched = [m or {"success": False, "error": "no result for this item in the batch response"} for m in matched]
+    failed = sum(1 for m in matched if not m["success"])
+    if failed:
+        inc("hubspot_batch_item_errors_total", failed)
+    return matched
+
+
+def _deal_properties(data: Dict) -> Dict:
+    return {
+        "dealname": f"Contract - {data.get('name', '')}",
+        "pipeline": "default",
+        "dealstage": "contractsent",
+    }
+
+
+# ==========================================================
+# PUBLIC FUNCTIONS
+# ==========================================================
+
+client = HubSpotClient()
+
+
+async def close_client():
+    await client.close()
+
+
+async def create_deal(data):
+    if not HUBSPOT_ACCESS_TOKEN:
+        return {"success": True, "deal_id": 9876}
+    return await client.create_deal(data)
+
+
+async def update_phone(contract_id, phone):
+    if not HUBSPOT_ACCESS_TOKEN:
+        return {"success": True}
+    return await client.update_phone(contract_id, phone)
+
+
+async def create_deals(items):
+    if not HUBSPOT_ACCESS_TOKEN:
+        return [{"success": True, "deal_id": 9876} for _ in items]
+    return await client.create_deals(items)
+
+
+async def update_phones(items):
+    if not HUBSPOT_ACCESS_TOKEN:
+        return [{"success": True} for _ in items]
+    return await client.update_phones(items)
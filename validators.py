@@ -1,41 +1,148 @@
 import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import PHONE_DEFAULT_COUNTRY_CODE
 
-def validate_email(email: str) -> tuple[bool, str]:
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if re.match(email_pattern, email.strip()):
-        return True, ""
-    return False, "Invalid email format. Please provide a valid email (e.g., example@gmail.com)"
-
-def validate_phone(phone: str) -> tuple[bool, str]:
-    cleaned = re.sub(r'[\s\-\(\)]', '', phone)
-    
-    phone_pattern = r'^\+?[0-9]{10,15}$'
-    if re.match(phone_pattern, cleaned):
-        return True, ""
-    return False, "Invalid phone number. Please provide a valid phone number (10-15 digits, optional + prefix)"
-
-def validate_name(name: str) -> tuple[bool, str]:
-    """Validate name format"""
-    name = name.strip()
-    if len(name) >= 2 and re.match(r'^[a-zA-Z\s]+$', name):
-        return True, ""
-    return False, "Invalid name. Please provide a valid name (at least 2 characters, letters only)"
-
-def validate_address(address: str) -> tuple[bool, str]:
-    address = address.strip()
-    if len(address) >= 5:
-        return True, ""
-    return False, "Invalid address. Please provide a complete address (at least 5 characters)"
-
-def validate_contract_id(contract_id: str) -> tuple[bool, str]:
-    if contract_id.strip().isdigit():
-        return True, ""
-    return False, "Invalid Contract ID. Please provide a numeric ID"
-
-VALIDATORS = {
-    "EMAIL": validate_email,
-    "NAME": validate_name,
-    "PHONE": validate_phone,
-    "ADDRESS": validate_address,
-    "CONTRACT_ID": validate_contract_id,
-}
\ No newline at end of file
+VECTORIZE_MIN = 50_000
+
+Result = Tuple[bool, str]
+OK: Result = (True, "")
+
+_pandas = False    # not looked up yet
+
+
+def load_pandas():
+    """
+    Optional: with pandas + pyarrow, validate_many runs large inputs through
+    Arrow's regex kernels. Imported on first use: pandas alone takes a few
+    hundred milliseconds to import. None when not installed.
+    """
+    global _pandas
+    if _pandas is False:
+        try:
+            import pandas
+            import pyarrow  # noqa: F401
+            _pandas = pandas
+        except ImportError:
+            _pandas = None
+    return _pandas
+
+
+class PatternValidator:
+    """
+    One precompiled check: the value is stripped (or has `remove`
+    characters deleted) and must fully match `pattern`. Called like the
+    old validate_* functions; `many` validates a whole column at once.
+    """
+
+    def __init__(self, pattern: str, message: str, remove: Optional[str] = None):
+        self.pattern = pattern
+        self.message = message
+        self.remove = remove
+        self._fullmatch = re.compile(pattern).fullmatch
+        self._delete = str.maketrans("", "", remove) if remove else None
+        self._bad: Result = (False, message)
+
+    def prepare(self, value: str) -> str:
+        return value.translate(self._delete) if self._delete else value.strip()
+
+    def __call__(self, value: str) -> Result:
+        return OK if self._fullmatch(self.prepare(value)) else self._bad
+
+    def many(self, values: Sequence[str]) -> List[Result]:
+        if len(values) >= VECTORIZE_MIN and load_pandas() is not None:
+            return self._many_vectorized(values)
+        fullmatch, prepare, bad = self._fullmatch, self.prepare, self._bad
+        return [OK if fullmatch(prepare(v)) else bad for v in values]
+
+    def _many_vectorized(self, values: Sequence[str]) -> List[Result]:
+        s = load_pandas().Series(values, dtype="string[pyarrow]")
+        if self.remove:
+            s = s.str.replace(f"[{re.escape(self.remove)}]", "", regex=True)
+        else:
+            s = s.str.strip()
+        matched = s.str.fullmatch(self.pattern).fillna(False).tolist()
+        return [OK if ok else self._bad for ok in matched]
+
+
+# ==========================================================
+# NORMALIZERS
+# ==========================================================
+
+PHONE_SEPARATORS = " \t\n\r\f\v-()"
+_PHONE_DELETE = str.maketrans("", "", PHONE_SEPARATORS)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def normalize_phone(phone: str) -> str:
+    """E.164: '+' and digits only; 10-digit national numbers get the default country code."""
+    cleaned = phone.translate(_PHONE_DELETE)
+    if cleaned.startswith("+"):
+        return cleaned
+    if len(cleaned) == 10:
+        return f"+{PHONE_DEFAULT_COUNTRY_CODE}{cleaned}"
+    return f"+{cleaned}"
+
+
+# ==========================================================
+# REGISTRY
+# ==========================================================
+
+VALIDATORS: Dict[str, Callable[[str], Result]] = {}
+NORMALIZERS: Dict[str, Callable[[str], str]] = {}
+
+
+def register(step: str, validate: Callable[[str], Result], normalize: Optional[Callable[[str], str]] = None):
+    """Set the validator (and optionally the normalizer) for a flow step."""
+    VALIDATORS[step] = validate
+    if normalize:
+        NORMALIZERS[step] = normalize
+    return validate
+
+
+def validate_many(step: str, values: Sequence[str]) -> List[Result]:
+    validate = VALIDATORS[step]
+    many = getattr(validate, "many", None)
+    if many is not None:
+        return many(values)
+    return [validate(v) for v in values]
+
+
+def normalize(step: str, value: str) -> str:
+    """Canonical form of a value that already passed validation."""
+    fn = NORMALIZERS.get(step)
+    return fn(value) if fn else value.strip()
+
+
+def normalize_many(step: str, values: Sequence[str]) -> List[str]:
+    fn = NORMALIZERS.get(step)
+    return [fn(v) for v in values] if fn else [v.strip() for v in values]
+
+
+validate_email = register("EMAIL", PatternValidator(
+    r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}",
+    "Invalid email format. Please provide a valid email (e.g., example@gmail.com)",
+), normalize_email)
+
+validate_name = register("NAME", PatternValidator(
+    r"[a-zA-Z\s]{2,}",
+    "Invalid name. Please provide a valid name (at least 2 characters, letters only)",
+))
+
+validate_phone = register("PHONE", PatternValidator(
+    r"\+?[0-9]{10,15}",
+    "Invalid phone number. Please provide a valid phone number (10-15 digits, optional + prefix)",
+    remove=PHONE_SEPARATORS,
+), normalize_phone)
+
+validate_address = register("ADDRESS", PatternValidator(
+    r"(?s).{5,}",
+    "Invalid address. Please provide a complete address (at least 5 characters)",
+))
+
+validate_contract_id = register("CONTRACT_ID", PatternValidator(
+    r"[0-9]+",
+    "Invalid Contract ID. Please provide a numeric ID",
+))